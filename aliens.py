@@ -3,9 +3,10 @@ import sys
 import codecs 
 import time
 import datetime
-from random import randrange
+import argparse
 from fenix.program import Program
-from fenix.process import Process 
+from fenix.process import Process, CompactProcess
+from fenix.bake import cache_directory
 import pygame
 from pygame.locals import *
 from fenix.locals import *
@@ -19,13 +20,44 @@ class Config:
 	fb_dev = "/dev/fb0"
 	lives = 4
 	bullets = 100
+	# size of the spatial hash cells used for collisions, None to disable
+	collision_cell_size = 64
+	# only redraw and update the changed parts of the screen, helps slow framebuffers
+	dirty_rects = False
+	# keep game speed steady on slow devices by skipping drawn frames
+	fixed_timestep = False
+	max_frame_skip = 5
+	interpolate = False
+	# frames drawn a second at most when interpolating
+	draw_fps = 60
+
+	# keys for each action
+	keys = {"up": K_UP, "down": K_DOWN, "left": K_LEFT, "right": K_RIGHT, "fire": K_SPACE, "start": K_RETURN, "quit": K_ESCAPE}
 
 	# retrolink gamepad axis buttons set up
 	# todo: replace this with your values
-	joystick_axis = {K_UP: (4, -1.00), K_DOWN: (4, 1.00), K_LEFT: (3, -1.00), K_RIGHT: (3, 1.00)}
-	joystick_buttons = {K_RETURN: 9, K_SPACE: 3, K_ESCAPE: 8}
+	joystick_axis = {"up": (4, -1), "down": (4, 1), "left": (3, -1), "right": (3, 1)}
+	# the gamepad keeps firing while its button is held, the keyboard fires on release
+	joystick_buttons = {"start": 9, "fire_held": 3, "quit": 8}
 	joystick_button_delay = 100
+	# frames to fade out and in when changing scenes
+	transition_frames = 15
+	# sprite sheet built with "python -m fenix.atlas gfx gfx/atlas", None to load every file on its own
+	atlas = "atlas.json"
+	# directory to keep graphics and sounds decoded in, for fast start up, None to decode every time
+	baked_assets = cache_directory("aliens")
+	# only start the pygame modules the game uses, when it first uses them
+	lazy_init = True
+	# time every frame, and show where the time goes when profiler_key is pressed
+	profiler = False
+	profiler_key = K_F12
  
+# collision layers
+L_SHIP = 1
+L_SHIP_BULLET = 2
+L_ENEMY = 4
+L_ENEMY_BULLET = 8
+
 class Game(Process):
 
 	screen_size = Config.default_screen_size
@@ -33,31 +65,34 @@ class Game(Process):
 	full_screen = Config.full_screen
 	window_title = "Aliens"
 	last_joystick_btn = 0
+	# scene to start with, the title screen if None
+	first_scene = None
 
 	@classmethod
-	def load_fnt(self, filename, size):
+	def path(self, folder, filename):
 		dirname, current_filename = os.path.split(os.path.abspath(__file__))
-		filename = os.path.join(dirname, 'gfx', filename)
-		return Program.load_fnt(filename, size)
+		return os.path.join(dirname, folder, filename)
+
+	@classmethod
+	def load_fnt(self, filename, size):
+		return Program.cached_fnt(Game.path('gfx', filename), size)
 
 	@classmethod
 	def load_png(self, filename):
-		dirname, current_filename = os.path.split(os.path.abspath(__file__))
-		filename = os.path.join(dirname, 'gfx', filename)
-		return Program.load_png(filename)
+		return Program.cached_png(Game.path('gfx', filename))
 
 	@classmethod
 	def load_wav(self, filename):
-		dirname, current_filename = os.path.split(os.path.abspath(__file__))
-		filename = os.path.join(dirname, 'sounds', filename)
-		return Program.load_wav(filename)
+		return Program.cached_wav(Game.path('sounds', filename))
 
 	def init_joystick(self):
 		try:
+			Program.require(pygame.joystick)
 			joystick = pygame.joystick.Joystick(0)
 			joystick.init()
 			if (joystick.get_init()):
 				self.joystick = joystick
+				Program.set_joystick(joystick)
 				self.joystick_name = joystick.get_name()
 				self.last_joystick_btn = 0
 			else:
@@ -65,28 +100,6 @@ class Game(Process):
 		except Exception as e:
 			self.joystick = None
 
-	def read_joystick(self):
-		result = []
-		if (self.joystick is not None):
-				pygame.event.pump()
-				for i in range(0, self.joystick.get_numaxes()):
-					axis_value = self.joystick.get_axis(i)
-					if (axis_value <= -0.90):
-						axis_value = -1.00
-					if (axis_value >= 0.90):
-						axis_value = 1.00
-
-					for btn, value in Config.joystick_axis.items():
-						if (value == (i, axis_value)):
-							result.append(btn)
-
-					for i in range(0, self.joystick.get_numbuttons()):
-						if self.joystick.get_button(i) != 0:
-							for btn, value in Config.joystick_buttons.items():
-								if (value == i):
-									result.append(btn)
-		return result
-
 	def begin(self):
 
 		# Set fb device for Raspberry pi
@@ -100,16 +113,42 @@ class Game(Process):
 		Program.set_fps(self.fps)
 		Program.set_title(self.window_title)
 
+		if (Config.baked_assets is not None):
+			Program.set_baked_assets(Config.baked_assets)
+
+		if (Config.atlas is not None and os.path.exists(Game.path('gfx', Config.atlas))):
+			Program.load_atlas(Game.path('gfx', Config.atlas))
+
+		if (Config.collision_cell_size is not None):
+			Program.enable_spatial_hash(Config.collision_cell_size)
+
+		Program.set_dirty_rects(Config.dirty_rects)
+
+		if (Config.fixed_timestep):
+			Program.set_fixed_timestep(True, Config.max_frame_skip, Config.interpolate, Config.draw_fps)
+
+		if (Config.profiler):
+			Program.enable_profiler(Config.profiler_key)
+
 		# set mouse invisible
 		pygame.mouse.set_visible(False)
 
 		self.init_joystick()
 
+		for action in set(Config.keys) | set(Config.joystick_axis) | set(Config.joystick_buttons):
+			keys = [Config.keys[action]] if action in Config.keys else []
+			axes = [Config.joystick_axis[action]] if action in Config.joystick_axis else []
+			buttons = [Config.joystick_buttons[action]] if action in Config.joystick_buttons else []
+			Program.bind_action(action, keys, axes, buttons)
+
 		self.font = Game.load_fnt("c64.ttf", 16)
 		self.big_font = Game.load_fnt("c64.ttf", 50)
 
 		# run scene
-		scene = Main(self);
+		if (self.first_scene is None):
+			scene = Main(self)
+		else:
+			scene = self.first_scene(self)
 		scene.lives = Config.lives
 		scene.bullets = Config.bullets
 
@@ -117,14 +156,14 @@ class Game(Process):
 			# This is the main loop
 
 			# Simple input check
-			if Program.key(K_ESCAPE) or (K_ESCAPE in self.read_joystick()):
+			if Program.action("quit"):
 				Program.exit()
 
 			yield
 
 
 	def millis(self):
-		return int(round(time.time() * 1000))
+		return Program.millis()
 
 
 class Bg(Process):
@@ -134,6 +173,10 @@ class Bg(Process):
 		self.graph = level.g_bg
 		self.x = level.game.screen_size[0]/2
 		self.y = level.game.screen_size[1] - (self.graph.get_height()/2)
+		self.static = True
+
+		# nothing left to do, the static layer keeps drawing it
+		self.signal(S_FREEZE)
 
 		while True:
 
@@ -146,14 +189,16 @@ class Sky(Process):
 	def begin(self, level):
 
 		screen_size = level.game.screen_size
-		self.g_star = Game.load_png("star.png")
+		self.g_star = level.g_star
 
 		for i in range(0, self.star_count):
-			size = randrange(10, 100)
-			x = randrange(0, screen_size[0])
-			y = randrange(0, screen_size[1])
+			size = Program.random.randrange(10, 100)
+			x = Program.random.randrange(0, screen_size[0])
+			y = Program.random.randrange(0, screen_size[1])
 			Star(self, x, y, size)
 
+		self.signal(S_FREEZE)
+
 		while True:
 
 			yield
@@ -167,6 +212,8 @@ class Star(Process):
 		self.graph = sky.g_star
 		self.size = size
 		self.z = 500
+		self.static = True
+		self.signal(S_FREEZE)
 
 		while True:
 
@@ -181,20 +228,81 @@ class Level(Process):
 	next_scene = None
 	txt_message_delay = 50
 	next_level = None
+	leaving = None
+
+	# attribute name -> file, for the graphics and sounds every level needs.
+	# Levels add their own in their resources, see manifest.
+	resources = {
+		"g_star": "star.png",
+		"g_ship1": "ship1.png",
+		"g_ship2": "ship2.png",
+		"g_bullet": "ship_bullet1.png",
+		"s_ship": "ship_motor4.wav",
+		"s_ship_explosion": "ship_explosion.wav",
+		"s_ship_collision": "ship_get_nyam.wav",
+		"s_bullet": "ship_rocket_start2.wav",
+	}
+
+	@classmethod
+	def manifest(cls):
+		# resources of this level and the ones it extends
+		manifest = {}
+		for klass in reversed(cls.__mro__):
+			manifest.update(klass.__dict__.get("resources", {}))
+		return manifest
+
+	@classmethod
+	def preload(cls):
+		# start loading this level's files in the background
+		pngs = []
+		wavs = []
+		for filename in cls.manifest().itervalues():
+			if filename.endswith(".wav"):
+				wavs.append(Game.path('sounds', filename))
+			else:
+				pngs.append(Game.path('gfx', filename))
+		Program.preload(cls.__name__, pngs, wavs)
+
+	def load(self):
+		# pooled bullets would keep the last level's graphics alive
+		Program.clear_pools()
+		# everything loaded now belongs to this level
+		Program.assets.enter_scope(self.__class__.__name__)
+		self.load_resources()
+		# whatever the last scene used and this one doesn't can go
+		Program.assets.collect()
 
 	def load_resources(self):
-		# common resources
-		self.g_ship1 = Game.load_png("ship1.png")
-		self.g_ship2 = Game.load_png("ship2.png")
-		self.g_bullet = Game.load_png("ship_bullet1.png")
-		self.s_ship = Game.load_wav("ship_motor4.wav")
-		self.s_ship_explosion = Game.load_wav("ship_explosion.wav")
-		self.s_ship_collision = Game.load_wav("ship_get_nyam.wav")
-		self.s_bullet = Game.load_wav("ship_rocket_start2.wav")
+		# already loaded if the level was preloaded
+		for name, filename in self.manifest().iteritems():
+			if filename.endswith(".wav"):
+				setattr(self, name, Game.load_wav(filename))
+			else:
+				setattr(self, name, Game.load_png(filename))
 
 		if (self.music is not None):
+			Program.require(pygame.mixer)
 			pygame.mixer.music.load(self.music)
 
+	def leave(self, scene, lives, bullets):
+		# called every frame once this scene is over: fades out while the next
+		# one loads in the background, then swaps to it. True once it has.
+		if (self.leaving is None):
+			self.leaving = 0
+			scene.preload()
+			Program.fade_off(Config.transition_frames)
+
+		self.leaving += 1
+		if (self.leaving < Config.transition_frames or not Program.assets_ready(scene.__name__)):
+			return False
+
+		self.signal(S_KILL, True)
+		self.game.scene = scene(self.game)
+		self.game.scene.lives = lives
+		self.game.scene.bullets = bullets
+		Program.fade_on(Config.transition_frames)
+		return True
+
 
 	def init_stat(self):
 		self.txt_level = Program.write(self.game.font, 0, 0, 0, '')
@@ -213,6 +321,10 @@ class Level(Process):
 
 	def update_stat(self):
 
+		if (self.next_scene is not None):
+			self.leave(self.next_scene, self.lives, self.bullets)
+			return
+
 		if (self.ship.health <= 0):
 			self.lives -= 1
 			if (self.lives >= 1):
@@ -228,16 +340,14 @@ class Level(Process):
 
 		if self.lives <= 0 and self.ship.health <= 0:
 			# todo: game over
-			self.signal(S_KILL, True)
-			self.game.scene = GameOver(self.game)
+			self.next_scene = GameOver
+			self.leave(self.next_scene, self.lives, self.bullets)
 			return
 
 		if self.enemies_count == 0:
 
-			self.signal(S_KILL, True)
-			self.game.scene = self.next_level(self.game)
-			self.game.scene.lives = self.lives
-			self.game.scene.bullets = self.bullets 
+			self.next_scene = self.next_level
+			self.leave(self.next_scene, self.lives, self.bullets)
 			return
 
 	def start(self):
@@ -249,6 +359,10 @@ class Level(Process):
 			except Exception as e:
 				pass
 
+	def on_exit(self):
+		# kept loaded until the next scene has claimed what it shares with this one
+		Program.assets.release_scope(self.__class__.__name__)
+
 	def sound(self, res):
 		try:
 			Program.play_wav(res);
@@ -265,7 +379,7 @@ class Main(Level):
 		self.music = "music/_music2.xm"
 		self.next_level = Level1
 
-		self.load_resources()
+		self.load()
 	
 		x = self.game.screen_size[0]/2
 		y = self.game.screen_size[1]/2
@@ -301,6 +415,7 @@ class Main(Level):
 		txt_copy3.colour = (0, 255, 0)
 
 		try:
+			Program.require(pygame.mixer)
 			pygame.mixer.music.load(self.music)
 			pygame.mixer.music.play(-1)
 		except Exception as e:
@@ -309,17 +424,19 @@ class Main(Level):
 		sky = Sky(self)
 		ship = Ship(self, -200, 150)
 
+		# get the first level loading while the title is up
+		self.next_level.preload()
+
 		while True:
 
 			ship.x += 4
 			if (ship.x > self.game.screen_size[0] + 200):
 				ship.x = -200
 
-			if Program.key_released(K_RETURN) or (K_RETURN in game.read_joystick()):
-				self.signal(S_KILL, True)
-				self.game.scene = Level1(self.game)
-				self.game.scene.lives = Config.lives
-				self.game.scene.bullets = Config.bullets 
+			if (self.next_scene is None and Program.action_released("start")):
+				self.next_scene = self.next_level
+
+			if (self.next_scene is not None and self.leave(self.next_scene, Config.lives, Config.bullets)):
 				return
 
 			yield
@@ -347,11 +464,10 @@ class GameOver(Level):
 
 		while True:
 
-			if Program.key_released(K_RETURN) or (K_RETURN in game.read_joystick()):
-				self.signal(S_KILL, True)
-				self.game.scene = Main(self.game)
-				self.game.scene.lives = Config.lives
-				self.game.scene.bullets = Config.bullets 
+			if (self.next_scene is None and Program.action_released("start")):
+				self.next_scene = self.next_level
+
+			if (self.next_scene is not None and self.leave(self.next_scene, Config.lives, Config.bullets)):
 				return
 
 			yield
@@ -379,32 +495,26 @@ class Won(Level):
 
 		while True:
 
-			if Program.key_released(K_RETURN) or (K_RETURN in game.read_joystick()):
-				self.signal(S_KILL, True)
-				self.game.scene = Main(self.game)
-				self.game.scene.lives = Config.lives
-				self.game.scene.bullets = Config.bullets 
+			if (self.next_scene is None and Program.action_released("start")):
+				self.next_scene = self.next_level
+
+			if (self.next_scene is not None and self.leave(self.next_scene, Config.lives, Config.bullets)):
 				return
 
 			yield
 
 class Level1(Level):
 
-	def load_resources(self):
-
-		super(Level1, self).load_resources()
-
-		# load gfx
-		self.g_enemy1 = Game.load_png("enemy1.png")
-		self.g_enemy1_1 = Game.load_png("enemy1_1.png")
-		self.g_enemy2 = Game.load_png("enemy2.png")
-		self.g_enemy2_2 = Game.load_png("enemy2_2.png")
-		self.g_enemy2_bullet = Game.load_png("enemy2_bullet.png")
-		self.g_bg = Game.load_png("bg_luna.png")
-
-		# load sounds
-		self.s_enemy2_bullet = Game.load_wav("enemy2_bullet.wav")
-
+	# graphics and sounds on top of the common ones
+	resources = {
+		"g_enemy1": "enemy1.png",
+		"g_enemy1_1": "enemy1_1.png",
+		"g_enemy2": "enemy2.png",
+		"g_enemy2_2": "enemy2_2.png",
+		"g_enemy2_bullet": "enemy2_bullet.png",
+		"g_bg": "bg_luna.png",
+		"s_enemy2_bullet": "enemy2_bullet.wav",
+	}
 
 	def begin(self, game):
 
@@ -415,7 +525,7 @@ class Level1(Level):
 		self.next_level = Level2
 
 	
-		self.load_resources()
+		self.load()
 		self.init_stat()
 		self.start()
 
@@ -432,20 +542,16 @@ class Level1(Level):
 
 class Level2(Level):
 
-	def load_resources(self):
-
-		super(Level2, self).load_resources()
-
-		# load gfx
-		self.g_enemy3 = Game.load_png("enemy3.png")
-		self.g_enemy3_1 = Game.load_png("enemy3_1.png")
-		self.g_enemy4 = Game.load_png("enemy4.png")
-		self.g_enemy4_1 = Game.load_png("enemy4_1.png")
-		self.g_enemy4_bullet = Game.load_png("enemy2_bullet.png")
-		self.g_bg = Game.load_png("bg_mars.png")
-
-		# load sounds
-		self.s_enemy4_bullet = Game.load_wav("enemy2_bullet.wav")
+	# graphics and sounds on top of the common ones
+	resources = {
+		"g_enemy3": "enemy3.png",
+		"g_enemy3_1": "enemy3_1.png",
+		"g_enemy4": "enemy4.png",
+		"g_enemy4_1": "enemy4_1.png",
+		"g_enemy4_bullet": "enemy2_bullet.png",
+		"g_bg": "bg_mars.png",
+		"s_enemy4_bullet": "enemy2_bullet.wav",
+	}
 
 	def begin(self, game):
 
@@ -455,7 +561,7 @@ class Level2(Level):
 		self.music = "music/_music7.xm"
 		self.next_level = Level3
 	
-		self.load_resources()
+		self.load()
 		self.init_stat()
 		self.start()
 
@@ -473,22 +579,18 @@ class Level2(Level):
 
 class Level3(Level):
 
-	def load_resources(self):
-
-		super(Level3, self).load_resources()
-
-		# load gfx
-		self.g_enemy5 = Game.load_png("enemy5.png")
-		self.g_enemy5_1 = Game.load_png("enemy5_1.png")
-		self.g_enemy6 = Game.load_png("enemy6.png")
-		self.g_enemy6_1 = Game.load_png("enemy6_1.png")
-		self.g_enemy7 = Game.load_png("enemy7.png")
-		self.g_enemy7_1 = Game.load_png("enemy7_1.png")
-		self.g_enemy5_bullet = Game.load_png("enemy2_bullet.png")
-		self.g_bg = Game.load_png("bg_neptun.png")
-
-		# load sounds
-		self.s_enemy5_bullet = Game.load_wav("enemy2_bullet.wav")
+	# graphics and sounds on top of the common ones
+	resources = {
+		"g_enemy5": "enemy5.png",
+		"g_enemy5_1": "enemy5_1.png",
+		"g_enemy6": "enemy6.png",
+		"g_enemy6_1": "enemy6_1.png",
+		"g_enemy7": "enemy7.png",
+		"g_enemy7_1": "enemy7_1.png",
+		"g_enemy5_bullet": "enemy2_bullet.png",
+		"g_bg": "bg_neptun.png",
+		"s_enemy5_bullet": "enemy2_bullet.wav",
+	}
 
 	def begin(self, game):
 
@@ -498,13 +600,13 @@ class Level3(Level):
 		self.music = "music/music.xm"
 		self.next_level = Level4
 	
-		self.load_resources()
+		self.load()
 		self.init_stat()
 		self.start()
 
 		Bg(self)
 		Sky(self)
-		enemies = [Enemy7(self, 400), Enemy6(self, randrange(500, 600)), Enemy5(self, 500, 340, 60), Enemy5(self, 500, 350, 70), Enemy5(self, 500, 360, 80), Enemy5(self, 500, 370, 90), Enemy5(self, 500, 380, 100)]
+		enemies = [Enemy7(self, 400), Enemy6(self, Program.random.randrange(500, 600)), Enemy5(self, 500, 340, 60), Enemy5(self, 500, 350, 70), Enemy5(self, 500, 360, 80), Enemy5(self, 500, 370, 90), Enemy5(self, 500, 380, 100)]
 		self.enemies_count = len(enemies)
 		self.ship = Ship(self)
 
@@ -516,20 +618,16 @@ class Level3(Level):
 
 class Level4(Level):
 
-	def load_resources(self):
-
-		super(Level4, self).load_resources()
-
-		# load gfx
-		self.g_enemy8 = Game.load_png("enemy8.png")
-		self.g_enemy8_1 = Game.load_png("enemy8_1.png")
-		self.g_enemy8_bullet1 = Game.load_png("enemy2_bullet.png")
-		self.g_enemy8_bullet2 = Game.load_png("enemy8_bullet2.png")
-		self.g_bg = Game.load_png("bg_venera.png")
-
-		# load sounds
-		self.s_enemy8_bullet1 = Game.load_wav("enemy2_bullet.wav")
-		self.s_enemy8_bullet2 = Game.load_wav("enemy8_bullet2.wav")
+	# graphics and sounds on top of the common ones
+	resources = {
+		"g_enemy8": "enemy8.png",
+		"g_enemy8_1": "enemy8_1.png",
+		"g_enemy8_bullet1": "enemy2_bullet.png",
+		"g_enemy8_bullet2": "enemy8_bullet2.png",
+		"g_bg": "bg_venera.png",
+		"s_enemy8_bullet1": "enemy2_bullet.wav",
+		"s_enemy8_bullet2": "enemy8_bullet2.wav",
+	}
 
 	def begin(self, game):
 
@@ -539,7 +637,7 @@ class Level4(Level):
 		self.music = "music/_music3.xm"
 		self.next_level = Level5
 	
-		self.load_resources()
+		self.load()
 		self.init_stat()
 		self.start()
 
@@ -557,14 +655,12 @@ class Level4(Level):
 
 class Level5(Level):
 
-	def load_resources(self):
-
-		super(Level5, self).load_resources()
-
-		# load gfx
-		self.g_enemy6 = Game.load_png("enemy6.png")
-		self.g_enemy6_1 = Game.load_png("enemy6_1.png")
-		self.g_bg = Game.load_png("bg_earth.png")
+	# graphics and sounds on top of the common ones
+	resources = {
+		"g_enemy6": "enemy6.png",
+		"g_enemy6_1": "enemy6_1.png",
+		"g_bg": "bg_earth.png",
+	}
 
 	def begin(self, game):
 
@@ -574,7 +670,7 @@ class Level5(Level):
 		self.music = "music/_music2.xm"
 		self.next_level = Won
 	
-		self.load_resources()
+		self.load()
 		self.init_stat()
 		self.start()
 
@@ -597,6 +693,8 @@ class Ship(Process):
 	speed = 10
 	rocket_offset = 30
 	last_enemy_collision = 0
+	collision_layer = L_SHIP
+	collision_mask = L_ENEMY
 
 	def begin(self, level, x = None, y = None):
 
@@ -621,13 +719,13 @@ class Ship(Process):
 
 			if (x == None and y == None):
 
-				if Program.key(K_UP) or (K_UP in level.game.read_joystick()):
+				if Program.action("up"):
 					self.y -= self.speed
-				if Program.key(K_DOWN) or (K_DOWN in level.game.read_joystick()):
+				if Program.action("down"):
 					self.y += self.speed
-				if Program.key(K_LEFT) or (K_LEFT in level.game.read_joystick()):
+				if Program.action("left"):
 					self.x -= self.speed
-				if Program.key(K_RIGHT) or (K_RIGHT in level.game.read_joystick()):
+				if Program.action("right"):
 					self.x += self.speed
 
 				# bounds
@@ -640,74 +738,38 @@ class Ship(Process):
 				if (self.y > self.level.game.screen_size[1] - self.graph.get_height()/2):
 					self.y = self.level.game.screen_size[1] - self.graph.get_height()/2
 
-			e = self.collision("Enemy1")
-			if e and level.game.millis() - self.last_enemy_collision > 500:
-				self.last_enemy_collision = level.game.millis()
-				level.sound(level.s_ship_collision)
-				self.health -= 10
-
-			e = self.collision("Enemy2")
-			if e and level.game.millis() - self.last_enemy_collision > 500:
-				self.last_enemy_collision = level.game.millis()
-				level.sound(level.s_ship_collision)
-				self.health -= 20
-
-			e = self.collision("Enemy3")
-			if e and level.game.millis() - self.last_enemy_collision > 500:
-				self.last_enemy_collision = level.game.millis()
-				level.sound(level.s_ship_collision)
-				self.health -= 30
-
-			e = self.collision("Enemy4")
-			if e and level.game.millis() - self.last_enemy_collision > 500:
-				self.last_enemy_collision = level.game.millis()
-				level.sound(level.s_ship_collision)
-				self.health -= 50
-
-			e = self.collision("Enemy5")
-			if e and level.game.millis() - self.last_enemy_collision > 500:
-				self.last_enemy_collision = level.game.millis()
-				level.sound(level.s_ship_collision)
-				self.health -= 10
-
-			e = self.collision("Enemy6")
-			if e and level.game.millis() - self.last_enemy_collision > 500:
-				self.last_enemy_collision = level.game.millis()
-				level.sound(level.s_ship_collision)
-				self.health -= 50
-
-			e = self.collision("Enemy7")
-			if e and level.game.millis() - self.last_enemy_collision > 500:
-				self.last_enemy_collision = level.game.millis()
-				level.sound(level.s_ship_collision)
-				self.health -= 20
-
-			e = self.collision("Enemy8")
-			if e and level.game.millis() - self.last_enemy_collision > 500:
-				self.last_enemy_collision = level.game.millis()
-				level.sound(level.s_ship_collision)
-				self.health -= 20
-
-			if Program.key_released(K_SPACE) or (K_SPACE in level.game.read_joystick() and level.game.millis() - level.game.last_joystick_btn > Config.joystick_button_delay):
+			# fire on release, or keep firing while a gamepad button is held
+			if Program.action_released("fire") or (level.game.joystick is not None and Program.action("fire_held") and level.game.millis() - level.game.last_joystick_btn > Config.joystick_button_delay):
 				level.game.last_joystick_btn = level.game.millis()
 				self.fire()
 
 			yield
 
+	def on_collision(self, enemy):
+		if self.level.game.millis() - self.last_enemy_collision > 500:
+			self.last_enemy_collision = self.level.game.millis()
+			self.level.sound(self.level.s_ship_collision)
+			self.health -= enemy.damage
+
 	def fire(self):
 		if self.level.bullets > 0:
-			ShipBullet(self.level, self, self.rocket_offset)			
+			ShipBullet.spawn(self.level, self, self.rocket_offset)			
 			self.rocket_offset = -self.rocket_offset
 			self.level.bullets -= 1
 
 class Enemy(Process):
 
+	damage = 10
+	collision_layer = L_ENEMY
+
 	def begin(self, level, x):
 		return
 
 
 class Enemy1(Enemy):
 
+	damage = 10
+
 	def begin(self, level, x):
 
 		self.graph = level.g_enemy1
@@ -737,6 +799,8 @@ class Enemy1(Enemy):
 
 class Enemy2(Enemy):
 
+	damage = 20
+
 	level = None
 
 	def begin(self, level, x):
@@ -764,15 +828,17 @@ class Enemy2(Enemy):
 			yield
 
 	def get_wait_fire(self):
-		return randrange(10, 200)
+		return Program.random.randrange(10, 200)
 
 	def fire(self):
-		Enemy2Bullet(self.level, self)
+		Enemy2Bullet.spawn(self.level, self)
 
 
 
 class Enemy3(Enemy):
 
+	damage = 30
+
 	def begin(self, level, x):
 
 		self.graph = level.g_enemy3
@@ -802,6 +868,8 @@ class Enemy3(Enemy):
 
 class Enemy4(Enemy):
 
+	damage = 50
+
 	level = None
 
 	def begin(self, level, x):
@@ -829,14 +897,16 @@ class Enemy4(Enemy):
 			yield
 
 	def get_wait_fire(self):
-		return randrange(10, 200)
+		return Program.random.randrange(10, 200)
 
 	def fire(self):
-		Enemy4Bullet(self.level, self)
+		Enemy4Bullet.spawn(self.level, self)
 
 
 class Enemy5(Enemy):
 
+	damage = 10
+
 	level = None
 
 	def begin(self, level, x, y, size):
@@ -865,16 +935,18 @@ class Enemy5(Enemy):
 			yield
 
 	def get_wait_fire(self):
-		return randrange(10, 200)
+		return Program.random.randrange(10, 200)
 
 	def fire(self):
-		Enemy5Bullet(self.level, self)
+		Enemy5Bullet.spawn(self.level, self)
 
 
 
 
 class Enemy6(Enemy):
 
+	damage = 50
+
 	def begin(self, level, x, y = None):
 
 		self.graph = level.g_enemy6
@@ -907,6 +979,8 @@ class Enemy6(Enemy):
 
 class Enemy7(Enemy):
 
+	damage = 20
+
 	def begin(self, level, x):
 
 		self.graph = level.g_enemy7
@@ -926,6 +1000,8 @@ class Enemy7(Enemy):
 
 class Enemy8(Enemy):
 
+	damage = 20
+
 	level = None
 
 	def begin(self, level, x):
@@ -965,23 +1041,30 @@ class Enemy8(Enemy):
 			yield
 
 	def get_wait_fire(self):
-		return randrange(10, 50)
+		return Program.random.randrange(10, 50)
 
 	def fire1(self):
-		Enemy8Bullet1(self.level, self, 5 , 3)
-		Enemy8Bullet1(self.level, self, 5 , 5)
-		Enemy8Bullet1(self.level, self, 5 , -1)
+		Enemy8Bullet1.spawn(self.level, self, 5 , 3)
+		Enemy8Bullet1.spawn(self.level, self, 5 , 5)
+		Enemy8Bullet1.spawn(self.level, self, 5 , -1)
 
 
 	def fire2(self):
-		Enemy8Bullet2(self.level, self, 5, 5)
-		Enemy8Bullet2(self.level, self, 3, 5)
-		Enemy8Bullet2(self.level, self, 5, -1)
+		Enemy8Bullet2.spawn(self.level, self, 5, 5)
+		Enemy8Bullet2.spawn(self.level, self, 3, 5)
+		Enemy8Bullet2.spawn(self.level, self, 5, -1)
+
+
+class ShipBullet(CompactProcess):
 
+	__slots__ = ("level",)
 
-class ShipBullet(Process):
+	pool_size = 32
+	collision_layer = L_SHIP_BULLET
+	collision_mask = L_ENEMY | L_ENEMY_BULLET
 
 	def begin(self, level, player, rocket_offset):
+		self.level = level
 		self.x = player.x + 60
 		self.y = player.y + rocket_offset
 
@@ -990,86 +1073,6 @@ class ShipBullet(Process):
 
 		while True:
 
-			e = self.collision("Enemy1")
-			if e:
-				level.sound(level.s_ship_explosion)
-				e.signal(S_KILL)
-				level.enemies_count -= 1
-				return
-
-			e = self.collision("Enemy2")
-			if e:
-				level.sound(level.s_ship_explosion)
-				e.signal(S_KILL)
-				level.enemies_count -= 1
-				return
-
-			e = self.collision("Enemy2Bullet")
-			if e:
-				level.sound(level.s_ship_explosion)
-				e.signal(S_KILL)
-				return
-
-			e = self.collision("Enemy3")
-			if e:
-				level.sound(level.s_ship_explosion)
-				e.signal(S_KILL)
-				level.enemies_count -= 1
-				return
-
-			e = self.collision("Enemy4")
-			if e:
-				level.sound(level.s_ship_explosion)
-				e.signal(S_KILL)
-				level.enemies_count -= 1
-				return
-
-			e = self.collision("Enemy4Bullet")
-			if e:
-				level.sound(level.s_ship_explosion)
-				e.signal(S_KILL)
-				return
-
-			e = self.collision("Enemy5")
-			if e:
-				level.sound(level.s_ship_explosion)
-				e.signal(S_KILL)
-				level.enemies_count -= 1
-				return
-
-			e = self.collision("Enemy5Bullet")
-			if e:
-				level.sound(level.s_ship_explosion)
-				e.signal(S_KILL)
-				return
-
-			e = self.collision("Enemy6")
-			if e:
-				level.sound(level.s_ship_explosion)
-				e.signal(S_KILL)
-				level.enemies_count -= 1
-				return
-
-			e = self.collision("Enemy7")
-			if e:
-				level.sound(level.s_ship_explosion)
-				e.signal(S_KILL)
-				level.enemies_count -= 1
-				return
-
-			e = self.collision("Enemy8")
-			if e:
-				level.sound(level.s_ship_explosion)
-				e.signal(S_KILL)
-				level.enemies_count -= 1
-				return
-
-			e = self.collision("Enemy8Bullet")
-			if e:
-				level.sound(level.s_ship_explosion)
-				e.signal(S_KILL)
-				return
-
 			#self.y += 10
 			self.x += 15
 			if (self.y < 0):
@@ -1084,9 +1087,32 @@ class ShipBullet(Process):
 
 			yield
 
-class Enemy2Bullet(Process):
+	def on_collision(self, other):
+		self.level.sound(self.level.s_ship_explosion)
+		other.signal(S_KILL)
+		if isinstance(other, Enemy):
+			self.level.enemies_count -= 1
+		self.signal(S_KILL)
+
+class EnemyBullet(CompactProcess):
+
+	__slots__ = ("level",)
+
+	pool_size = 32
+	collision_layer = L_ENEMY_BULLET
+	collision_mask = L_SHIP
+
+	def on_collision(self, ship):
+		self.level.sound(self.level.s_ship_explosion)
+		self.level.ship.health -= 100
+		self.signal(S_KILL)
+
+class Enemy2Bullet(EnemyBullet):
+
+	__slots__ = ()
 
 	def begin(self, level, enemy):
+		self.level = level
 		self.x = enemy.x - enemy.graph.get_width()/2
 		self.y = enemy.y - 70
 
@@ -1095,14 +1121,6 @@ class Enemy2Bullet(Process):
 
 		while True:
 
-			e = self.collision("Ship")
-			if e:
-				level.sound(level.s_ship_explosion)
-				level.ship.health -= 100
-				#if (level.ship.health <= 0):
-				#	e.signal(S_KILL)
-				return
-
 			self.y -= 2
 			self.x -= 5
 			if (self.y < 0 or self.y > level.game.screen_size[1]):
@@ -1112,9 +1130,12 @@ class Enemy2Bullet(Process):
 
 			yield
 
-class Enemy4Bullet(Process):
+class Enemy4Bullet(EnemyBullet):
+
+	__slots__ = ()
 
 	def begin(self, level, enemy):
+		self.level = level
 		self.x = enemy.x - enemy.graph.get_width()/2
 		self.y = enemy.y - 40
 
@@ -1123,14 +1144,6 @@ class Enemy4Bullet(Process):
 
 		while True:
 
-			e = self.collision("Ship")
-			if e:
-				level.sound(level.s_ship_explosion)
-				level.ship.health -= 100
-				#if (level.ship.health <= 0):
-				#	e.signal(S_KILL)
-				return
-
 			#self.y -= 2
 			self.x -= 5
 			if (self.y < 0 or self.y > level.game.screen_size[1]):
@@ -1140,9 +1153,12 @@ class Enemy4Bullet(Process):
 
 			yield
 
-class Enemy5Bullet(Process):
+class Enemy5Bullet(EnemyBullet):
+
+	__slots__ = ()
 
 	def begin(self, level, enemy):
+		self.level = level
 
 		self.graph = level.g_enemy5_bullet
 
@@ -1153,12 +1169,6 @@ class Enemy5Bullet(Process):
 
 		while True:
 
-			e = self.collision("Ship")
-			if e:
-				level.sound(level.s_ship_explosion)
-				level.ship.health -= 100
-				return
-
 			#self.y -= 2
 			self.x -= 5
 			if (self.y < 0 or self.y > level.game.screen_size[1]):
@@ -1169,9 +1179,20 @@ class Enemy5Bullet(Process):
 			yield
 
 
-class Enemy8Bullet1(Process):
+class Enemy8Bullet(EnemyBullet):
+
+	__slots__ = ()
+
+	def begin(self, level, enemy, offset_x, offset_y):
+		return
+
+
+class Enemy8Bullet1(Enemy8Bullet):
+
+	__slots__ = ()
 
 	def begin(self, level, enemy, offset_x = 5, offset_y = 3):
+		self.level = level
 
 		self.graph = level.g_enemy8_bullet1
 
@@ -1182,12 +1203,6 @@ class Enemy8Bullet1(Process):
 
 		while True:
 
-			e = self.collision("Ship")
-			if e:
-				level.sound(level.s_ship_explosion)
-				level.ship.health -= 100
-				return
-
 			self.y -= offset_y
 			self.x -= offset_x
 			if (self.y < 0 or self.y > level.game.screen_size[1]):
@@ -1197,9 +1212,12 @@ class Enemy8Bullet1(Process):
 
 			yield
 
-class Enemy8Bullet2(Process):
+class Enemy8Bullet2(Enemy8Bullet):
+
+	__slots__ = ()
 
 	def begin(self, level, enemy, offset_x = 5, offset_y = 5):
+		self.level = level
 
 		self.graph = level.g_enemy8_bullet2
 
@@ -1210,12 +1228,6 @@ class Enemy8Bullet2(Process):
 
 		while True:
 
-			e = self.collision("Ship")
-			if e:
-				level.sound(level.s_ship_explosion)
-				level.ship.health -= 100
-				return
-
 			self.y -= offset_y
 			self.x -= offset_x
 			if (self.y < 0 or self.y > level.game.screen_size[1]):
@@ -1227,4 +1239,24 @@ class Enemy8Bullet2(Process):
 
 
 if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = "Aliens vs Humans")
+	parser.add_argument("--headless", action = "store_true", help = "run without display, sound or frame rate limit")
+	parser.add_argument("--seed", type = int, default = None, help = "seed for everything random")
+	parser.add_argument("--frames", type = int, default = None, help = "quit after this many frames")
+	parser.add_argument("--profile", action = "store_true", help = "time every frame, F12 shows where the time goes")
+	parser.add_argument("--startup-report", action = "store_true", help = "print where start up time went after the first frame")
+	# app bundles can pass extra arguments of their own
+	args, unknown = parser.parse_known_args()
+
+	if (args.headless):
+		Program.set_headless(args.seed, args.frames)
+	else:
+		Program.seed(args.seed)
+		Program.max_frames = args.frames
+
+	if (args.profile):
+		Config.profiler = True
+
+	Program.set_lazy_init(Config.lazy_init, args.startup_report)
+
 	Game()
@@ -0,0 +1,368 @@
+"""
+Measures how fast the engine runs the game's scenes.
+
+Every scenario runs headless in its own python process, with scripted
+input and a fixed seed, so runs can be compared with each other:
+
+	python benchmark.py --output results.json
+	python benchmark.py --baseline results.json
+	python benchmark.py --scenario stress --bullets 500 --enemies 100
+
+--processes compares the memory and attribute access cost of Process and
+CompactProcess instead:
+
+	python benchmark.py --processes 5000
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+import tempfile
+
+from timeit import default_timer
+
+from fenix.program import Program
+from fenix.process import Process, CompactProcess
+from fenix.bullets import BulletSystem
+from fenix.profiler import FrameTimer, PHASES
+from fenix.locals import *
+from pygame.locals import *
+import aliens
+
+
+SCENARIOS = ("main", "level1", "level2", "level3", "level4", "level5", "stress")
+
+
+class Spot(object):
+	""" Somewhere for a ShipBullet to be fired from """
+
+	def __init__(self, x, y):
+		self.x = x
+		self.y = y
+
+
+class StressShipBullets(BulletSystem):
+	""" The ship's bullets for the stress scene's --bullet-system mode """
+
+	collision_layer = aliens.L_SHIP_BULLET
+	collision_mask = aliens.L_ENEMY | aliens.L_ENEMY_BULLET
+
+	def on_hit(self, other, x, y):
+		if not isinstance(other, BulletSystem):
+			other.signal(S_KILL)
+
+
+class StressEnemyBullets(BulletSystem):
+
+	collision_layer = aliens.L_ENEMY_BULLET
+	collision_mask = aliens.L_SHIP
+
+
+class StressLevel(aliens.Level):
+	""" Keeps the screen full of bullets and Enemy5 sprites """
+
+	bullet_count = 200
+	enemy_count = 50
+	# bullets in two BulletSystems rather than a process each
+	bullet_system = False
+
+	resources = {
+		"g_enemy5": "enemy5.png",
+		"g_enemy5_1": "enemy5_1.png",
+		"g_enemy5_bullet": "enemy2_bullet.png",
+		"g_enemy8_bullet1": "enemy2_bullet.png",
+		"g_bg": "bg_neptun.png",
+		"s_enemy5_bullet": "enemy2_bullet.wav",
+		"s_enemy8_bullet1": "enemy2_bullet.wav",
+	}
+
+	def begin(self, game):
+
+		self.name = "stress"
+		self.description = "Stress"
+		self.game = game
+		self.lives = 1000
+
+		self.load()
+
+		aliens.Bg(self)
+		aliens.Sky(self)
+		self.ship = aliens.Ship(self)
+
+		width, height = game.screen_size
+		random = Program.random
+
+		if self.bullet_system:
+			ship_system = StressShipBullets()
+			enemy_system = StressEnemyBullets()
+
+		while True:
+
+			# top everything back up as it dies or flies away
+			enemies = Program.processes_by_type("Enemy5")
+			for i in range(len(enemies), self.enemy_count):
+				enemies.append(aliens.Enemy5(self, random.randrange(width / 2, width), random.randrange(0, height), random.randrange(40, 100)))
+			self.enemies_count = len(enemies)
+
+			# enemies made this frame have no graph to fire from yet
+			shooters = [enemy for enemy in enemies if enemy.graph is not None]
+
+			if self.bullet_system:
+				# the same speeds and starting points as the bullet processes below
+				for i in range(ship_system.count, self.bullet_count):
+					ship_system.fire(self.g_bullet, random.randrange(0, width / 2) + 60, random.randrange(0, height), 15, 0)
+				for i in range(enemy_system.count, self.bullet_count if shooters else 0):
+					enemy = random.choice(shooters)
+					x = enemy.x - enemy.graph.get_width() / 2
+					y = enemy.y - enemy.graph.get_height() / 2 + self.g_enemy8_bullet1.get_height() / 2 + 20
+					enemy_system.fire(self.g_enemy8_bullet1, x, y, -random.randrange(2, 8), -random.randrange(-3, 4))
+			else:
+				ship_bullets = len(Program.type_bucket("ShipBullet"))
+				for i in range(ship_bullets, self.bullet_count):
+					aliens.ShipBullet.spawn(self, Spot(random.randrange(0, width / 2), random.randrange(0, height)), 0)
+
+				enemy_bullets = len(Program.type_bucket("Enemy8Bullet1"))
+				for i in range(enemy_bullets, self.bullet_count if shooters else 0):
+					aliens.Enemy8Bullet1.spawn(self, random.choice(shooters), random.randrange(2, 8), random.randrange(-3, 4))
+
+			self.ship.health = 100
+
+			yield
+
+
+class PlainProbe(Process):
+	pass
+
+
+class CompactProbe(CompactProcess):
+	__slots__ = ()
+
+
+class ProcessBenchmark(Process):
+	""" Makes count processes of each kind, measures them and quits """
+
+	def begin(self, count, repeats, results):
+		Program.set_mode((320, 240))
+		for name, klass in (("Process", PlainProbe), ("CompactProcess", CompactProbe)):
+			results[name] = measure_processes(klass, count, repeats)
+		yield
+
+
+def instance_bytes(obj):
+	""" Memory an instance takes itself, including its __dict__ if it has one """
+	size = sys.getsizeof(obj)
+	if hasattr(obj, "__dict__"):
+		size += sys.getsizeof(obj.__dict__)
+	return size
+
+
+def measure_processes(klass, count, repeats):
+	""" Returns bytes per instance of klass, and microseconds to make one and
+	to do to one what a frame does to every process """
+	started = default_timer()
+	processes = [klass() for i in range(count)]
+	made = default_timer() - started
+
+	size = sum(instance_bytes(obj) for obj in processes) / float(count)
+
+	started = default_timer()
+	for i in range(repeats):
+		for obj in processes:
+			obj.x += 1
+			obj.y -= 1
+			obj.graph, obj.size, obj.angle, obj.flags, obj.alpha
+			obj.z, obj.priority, obj.status
+			obj.father, obj.son, obj.bigbro
+	accessed = default_timer() - started
+
+	for obj in processes:
+		obj.signal(S_KILL)
+
+	return {
+		"bytes": size,
+		"create": 1000000.0 * made / count,
+		"access": 1000000.0 * accessed / (count * repeats),
+	}
+
+
+def run_process_benchmark(count, repeats):
+	""" Compares Process and CompactProcess, each with count alive at once """
+	results = {}
+	Program.set_headless(1, 1)
+	Program.set_sound(False)
+	ProcessBenchmark(count, repeats, results)
+
+	for name in ("Process", "CompactProcess"):
+		result = results[name]
+		print "%-14s %7.1f bytes  create %6.2f us  access %6.3f us" % (name, result["bytes"], result["create"], result["access"])
+	return results
+
+
+def level_script(frame):
+	""" Flies the ship around in a loop without firing, so the level never ends """
+	keys = []
+	keys.append(K_UP if (frame // 30) % 2 == 0 else K_DOWN)
+	if (frame // 45) % 3 == 0:
+		keys.append(K_RIGHT)
+	elif (frame // 45) % 3 == 1:
+		keys.append(K_LEFT)
+	return keys
+
+
+def no_script(frame):
+	return ()
+
+
+def run_scenario(name, args):
+	""" Runs one scenario in this process and returns its timing summary """
+
+	timer = FrameTimer(args.warmup, args.by_class)
+	Program.set_headless(args.seed, args.warmup + args.frames)
+	Program.set_frame_timer(timer)
+	Program.set_sound(args.sound)
+
+	if (name == "main"):
+		Program.set_input_script(no_script)
+	else:
+		Program.set_input_script(level_script)
+
+	if (name == "stress"):
+		StressLevel.bullet_count = args.bullets
+		StressLevel.enemy_count = args.enemies
+		StressLevel.bullet_system = args.bullet_system
+		aliens.Game.first_scene = StressLevel
+	elif (name.startswith("level")):
+		aliens.Game.first_scene = getattr(aliens, "Level" + name[5:])
+
+	aliens.Config.lives = 1000
+	Program.set_lazy_init(aliens.Config.lazy_init)
+	aliens.Config.full_screen = False
+	aliens.Game.full_screen = False
+
+	aliens.Game()
+
+	result = timer.summary()
+	result["startup"] = Program.startup.summary()
+	if (name == "stress"):
+		result["bullets"] = args.bullets
+		result["enemies"] = args.enemies
+		result["bullet_system"] = args.bullet_system
+	return result
+
+
+def run_all(names, args):
+	""" Runs each scenario in a fresh python, as the engine only starts once per process """
+	results = {}
+	script = os.path.abspath(__file__)
+
+	for name in names:
+		handle, path = tempfile.mkstemp(suffix = ".json")
+		os.close(handle)
+		try:
+			command = [sys.executable, script, "--run", name, "--result", path,
+					   "--frames", str(args.frames), "--warmup", str(args.warmup), "--seed", str(args.seed),
+					   "--bullets", str(args.bullets), "--enemies", str(args.enemies)]
+			if (args.sound):
+				command.append("--sound")
+			if (args.by_class):
+				command.append("--by-class")
+			if (args.bullet_system):
+				command.append("--bullet-system")
+			with open(os.devnull, "w") as devnull:
+				subprocess.check_call(command, stdout = devnull)
+			with open(path) as result_file:
+				results[name] = json.load(result_file)
+		finally:
+			os.remove(path)
+
+		print_result(name, results[name])
+
+	return results
+
+
+def print_result(name, result):
+	frame = result["frame"]
+	phases = "  ".join("%s %.2f" % (phase, result["phases"][phase]["p50"]) for phase in PHASES)
+	print "%-8s %7.1f fps  p50 %6.2f  p95 %6.2f  p99 %6.2f ms  first frame %6.1f ms  (%s)" % (name, result["fps"], frame["p50"], frame["p95"], frame["p99"], result["startup"]["first_frame"], phases)
+
+
+def compare(results, baseline, tolerance):
+	""" Prints the change of every scenario against the baseline and returns
+	the names that got slower than tolerance allows """
+	regressions = []
+	print
+	print "%-8s %-4s %10s %10s %8s" % ("scenario", "", "baseline", "current", "change")
+
+	for name in sorted(results):
+		if name not in baseline["scenarios"]:
+			continue
+		for stat in ("p50", "p95", "p99"):
+			before = baseline["scenarios"][name]["frame"][stat]
+			after = results[name]["frame"][stat]
+			change = (after - before) / before if before > 0 else 0.0
+			flag = ""
+			if change > tolerance:
+				flag = " slower"
+				if name not in regressions:
+					regressions.append(name)
+			print "%-8s %-4s %8.2fms %8.2fms %+7.1f%%%s" % (name, stat, before, after, change * 100, flag)
+
+	return regressions
+
+
+def main():
+	parser = argparse.ArgumentParser(description = "Benchmarks the fenix engine with the game's scenes")
+	parser.add_argument("--scenario", action = "append", choices = SCENARIOS, help = "scenario to run, can be repeated, all of them by default")
+	parser.add_argument("--frames", type = int, default = 600, help = "frames to measure per scenario")
+	parser.add_argument("--warmup", type = int, default = 30, help = "frames to run before measuring")
+	parser.add_argument("--seed", type = int, default = 1)
+	parser.add_argument("--bullets", type = int, default = 200, help = "ShipBullet and Enemy8Bullet1 count each in the stress scene")
+	parser.add_argument("--enemies", type = int, default = 50, help = "Enemy5 count in the stress scene")
+	parser.add_argument("--bullet-system", action = "store_true", help = "keep the stress scene's bullets in numpy BulletSystems rather than a process each")
+	parser.add_argument("--sound", action = "store_true", help = "play sound effects, they're left out of the measurements by default")
+	parser.add_argument("--by-class", action = "store_true", help = "also time draw and loop per process class")
+	parser.add_argument("--output", help = "write the results to this json file")
+	parser.add_argument("--baseline", help = "compare against the results in this json file")
+	parser.add_argument("--tolerance", type = float, default = 0.1, help = "slow down allowed against the baseline before failing")
+	parser.add_argument("--processes", type = int, help = "instead of the scenarios, compare memory and attribute access of this many Process and CompactProcess instances")
+	parser.add_argument("--repeats", type = int, default = 100, help = "frames worth of attribute access to time with --processes")
+	parser.add_argument("--run", choices = SCENARIOS, help = argparse.SUPPRESS)
+	parser.add_argument("--result", help = argparse.SUPPRESS)
+	args = parser.parse_args()
+
+	if (args.run is not None):
+		with open(args.result, "w") as result_file:
+			json.dump(run_scenario(args.run, args), result_file)
+		return 0
+
+	if (args.processes is not None):
+		results = run_process_benchmark(args.processes, args.repeats)
+		if (args.output is not None):
+			with open(args.output, "w") as output_file:
+				json.dump({"processes": args.processes, "repeats": args.repeats, "results": results}, output_file, indent = 2, sort_keys = True)
+		return 0
+
+	results = run_all(args.scenario or SCENARIOS, args)
+
+	if (args.output is not None):
+		with open(args.output, "w") as output_file:
+			json.dump({
+				"frames": args.frames,
+				"warmup": args.warmup,
+				"seed": args.seed,
+				"scenarios": results,
+			}, output_file, indent = 2, sort_keys = True)
+
+	if (args.baseline is not None):
+		with open(args.baseline) as baseline_file:
+			baseline = json.load(baseline_file)
+		if compare(results, baseline, args.tolerance):
+			return 1
+
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,82 @@
+""" Logical actions read from the keyboard and joystick once per frame """
+
+from collections import namedtuple
+
+
+# Which actions are held this frame, and which went down or up since the last
+InputSnapshot = namedtuple("InputSnapshot", "held pressed released")
+
+NO_INPUT = InputSnapshot(frozenset(), frozenset(), frozenset())
+
+# How far an axis has to be pushed to count
+AXIS_THRESHOLD = 0.9
+
+
+class ActionMap(object):
+	""" Keys, joystick axes and joystick buttons bound to action names """
+
+	def __init__(self):
+		self.bindings = {}
+		# the same, less axes and buttons the joystick doesn't have
+		self.usable = {}
+		self.num_axes = 0
+		self.num_buttons = 0
+
+
+	def bind(self, action, keys = (), axes = (), buttons = ()):
+		""" Adds inputs that hold action down. axes are (axis, direction)
+		tuples, where direction is -1 or 1. """
+		binding = self.bindings.setdefault(action, ([], [], []))
+		binding[0].extend(keys)
+		binding[1].extend(axes)
+		binding[2].extend(buttons)
+		self.fit()
+
+
+	def unbind(self, action):
+		self.bindings.pop(action, None)
+		self.usable.pop(action, None)
+
+
+	def set_joystick(self, joystick):
+		""" Leaves out the axes and buttons bound that joystick doesn't have,
+		pygame raises an error asking for those. None leaves out all of them. """
+		self.num_axes = 0 if joystick == None else joystick.get_numaxes()
+		self.num_buttons = 0 if joystick == None else joystick.get_numbuttons()
+		self.fit()
+
+
+	def fit(self):
+		self.usable = {}
+		for action, (keys, axes, buttons) in self.bindings.iteritems():
+			self.usable[action] = (keys,
+				[(axis, direction) for axis, direction in axes if axis < self.num_axes],
+				[button for button in buttons if button < self.num_buttons])
+
+
+	def sample(self, keys_pressed, joystick, previous):
+		""" Returns the InputSnapshot for this frame, given the result of
+		pygame.key.get_pressed, a joystick or None, and the last snapshot """
+		held = set()
+
+		for action, (keys, axes, buttons) in self.usable.iteritems():
+			for key_type in keys:
+				if keys_pressed[key_type]:
+					held.add(action)
+					break
+
+			if joystick == None or action in held:
+				continue
+
+			for axis, direction in axes:
+				if joystick.get_axis(axis) * direction >= AXIS_THRESHOLD:
+					held.add(action)
+					break
+			else:
+				for button in buttons:
+					if joystick.get_button(button):
+						held.add(action)
+						break
+
+		held = frozenset(held)
+		return InputSnapshot(held, held - previous.held, previous.held - held)
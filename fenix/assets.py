@@ -0,0 +1,141 @@
+""" Loaded graphics, sounds and fonts shared by everything that asks for the same file """
+
+import os
+
+import pygame
+
+from cache import surface_bytes
+
+
+def sound_bytes(sound):
+	""" Approximate memory held by a sound's samples """
+	mixer = pygame.mixer.get_init()
+	if mixer == None:
+		return 0
+	frequency, bits, channels = mixer
+	return int(sound.get_length() * frequency) * channels * (abs(bits) // 8)
+
+
+class Asset(object):
+	""" A loaded file and the scopes that asked for it """
+
+	__slots__ = ("kind", "path", "value", "bytes", "scopes")
+
+	def __init__(self, kind, path, value, size):
+		self.kind = kind
+		self.path = path
+		self.value = value
+		self.bytes = size
+		self.scopes = set()
+
+
+class AssetCache(object):
+	""" Loads every file once. Assets are claimed by the scope current when
+	they're asked for, usually a level. Releasing a scope only forgets its
+	claims, so the next level can pick up what it shares with the last one;
+	collect then throws away whatever nobody claims any more. """
+
+	GLOBAL = "global"
+
+	def __init__(self):
+		self.assets = {}
+		self.scope = self.GLOBAL
+		self.hits = 0
+		self.misses = 0
+		self.collected = 0
+
+
+	def enter_scope(self, scope):
+		""" Makes scope claim everything asked for from now on """
+		self.scope = scope
+
+
+	def release_scope(self, scope):
+		""" Drops everything scope claimed. Nothing is unloaded until collect. """
+		for asset in self.assets.itervalues():
+			asset.scopes.discard(scope)
+		if self.scope == scope:
+			self.scope = self.GLOBAL
+
+
+	def collect(self):
+		""" Forgets assets no scope claims. Returns how many bytes that freed. """
+		freed = 0
+		for key, asset in self.assets.items():
+			if not asset.scopes:
+				freed += asset.bytes
+				self.collected += 1
+				del self.assets[key]
+		return freed
+
+
+	def key(self, kind, path, *args):
+		return (kind, os.path.abspath(path)) + args
+
+
+	def load(self, kind, path, loader, size_of, *args):
+		""" Returns the asset of kind at path, calling loader(path, *args) the
+		first time. Different args make different assets. """
+		key = self.key(kind, path, *args)
+		asset = self.assets.get(key)
+		if asset == None:
+			self.misses += 1
+			value = loader(key[1], *args)
+			asset = self.assets[key] = Asset(kind, key[1], value, size_of(value))
+		else:
+			self.hits += 1
+		asset.scopes.add(self.scope)
+		return asset.value
+
+
+	def claim(self, scope, key):
+		""" Makes scope claim the asset under key, if it's loaded. Returns whether it was. """
+		asset = self.assets.get(key)
+		if asset == None:
+			return False
+		asset.scopes.add(scope)
+		return True
+
+
+	def store(self, scopes, key, value, size):
+		""" Adds an asset that was loaded somewhere else, claimed by scopes """
+		asset = self.assets.get(key)
+		if asset == None:
+			self.misses += 1
+			asset = self.assets[key] = Asset(key[0], key[1], value, size)
+		asset.scopes.update(scopes)
+		return asset.value
+
+
+	def clear(self):
+		self.assets = {}
+
+
+	def stats(self):
+		""" Returns a dictionary of counts and bytes held, in total, by kind and by scope """
+		kinds = {}
+		scopes = {}
+		total = 0
+		unclaimed = 0
+		for asset in self.assets.itervalues():
+			total += asset.bytes
+			kind = kinds.setdefault(asset.kind, {"entries": 0, "bytes": 0})
+			kind["entries"] += 1
+			kind["bytes"] += asset.bytes
+			if not asset.scopes:
+				unclaimed += 1
+			for scope in asset.scopes:
+				scope_stats = scopes.setdefault(str(scope), {"entries": 0, "bytes": 0})
+				scope_stats["entries"] += 1
+				scope_stats["bytes"] += asset.bytes
+
+		return {
+			"entries": len(self.assets),
+			"bytes": total,
+			"unclaimed": unclaimed,
+			"kinds": kinds,
+			"scopes": scopes,
+			"hits": self.hits,
+			"misses": self.misses,
+			"collected": self.collected,
+		}
@@ -0,0 +1,161 @@
+"""
+Texture atlases: many small graphics packed onto a few big sheets.
+
+Build one from a directory of pngs with
+
+	python -m fenix.atlas gfx gfx/atlas
+
+which writes gfx/atlas.json and the sheets next to it. Once loaded with
+Program.load_atlas, cached_png hands out subsurfaces of the sheets for
+every file the atlas holds, and they work anywhere a graph does.
+"""
+
+import os
+import json
+import argparse
+
+import pygame
+
+
+def pack(sizes, sheet_size, padding = 1):
+	"""
+	Packs rectangles onto as few sheets as possible, in rows of similar
+	height. sizes is a dictionary of name -> (width, height). Returns a
+	dictionary of name -> (sheet, x, y, width, height).
+	"""
+	placed = {}
+	sheet = 0
+	x = y = row_height = 0
+
+	# tallest first, so each row wastes little space above its shorter ones
+	for name in sorted(sizes, key = lambda name: (-sizes[name][1], -sizes[name][0], name)):
+		width, height = sizes[name]
+		if width > sheet_size or height > sheet_size:
+			raise ValueError("%s is bigger than a %d pixel sheet" % (name, sheet_size))
+
+		if x + width > sheet_size:
+			x = 0
+			y += row_height + padding
+			row_height = 0
+		if y + height > sheet_size:
+			sheet += 1
+			x = y = row_height = 0
+
+		placed[name] = (sheet, x, y, width, height)
+		x += width + padding
+		row_height = max(row_height, height)
+
+	return placed
+
+
+def build(source, output, sheet_size = 1024, max_sprite = 512, padding = 1):
+	"""
+	Packs every png in source no bigger than max_sprite on either side into
+	sheets named after output, then writes output + ".json" indexing them.
+	Bigger images, such as backgrounds, are left as they are. Returns the
+	index.
+	"""
+	images = {}
+	for filename in sorted(os.listdir(source)):
+		path = os.path.join(source, filename)
+		if not filename.endswith(".png") or os.path.abspath(path).startswith(os.path.abspath(output)):
+			continue
+		image = pygame.image.load(path)
+		width, height = image.get_size()
+		if width <= max_sprite and height <= max_sprite:
+			images[filename] = image
+
+	placed = pack(dict((name, image.get_size()) for name, image in images.iteritems()), sheet_size, padding)
+	sheet_count = max([entry[0] for entry in placed.itervalues()] or [-1]) + 1
+
+	# each sheet is only as big as what's on it
+	sheets = []
+	for i in range(sheet_count):
+		entries = [entry for entry in placed.itervalues() if entry[0] == i]
+		width = max(x + w for sheet, x, y, w, h in entries)
+		height = max(y + h for sheet, x, y, w, h in entries)
+		surface = pygame.Surface((width, height), pygame.SRCALPHA, 32)
+		surface.fill((0, 0, 0, 0))
+		sheets.append(surface)
+
+	for name, (sheet, x, y, width, height) in placed.iteritems():
+		image = images[name]
+		if image.get_flags() & pygame.SRCALPHA:
+			# a plain blit would blend it with the empty sheet, adding copies it as it is
+			sheets[sheet].blit(image, (x, y), None, pygame.BLEND_RGBA_ADD)
+		else:
+			sheets[sheet].blit(image, (x, y))
+
+	names = []
+	for i, surface in enumerate(sheets):
+		name = "%s_%d.png" % (os.path.basename(output), i)
+		pygame.image.save(surface, os.path.join(os.path.dirname(output), name))
+		names.append(name)
+
+	index = {
+		"sheets": names,
+		"sprites": dict((name, list(entry)) for name, entry in placed.iteritems()),
+	}
+	index_file = open(output + ".json", "w")
+	try:
+		json.dump(index, index_file, sort_keys = True)
+	finally:
+		index_file.close()
+	return index
+
+
+class Atlas(object):
+	""" A loaded atlas, handing out a subsurface of its sheets per sprite """
+
+	def __init__(self, index_path, load_sheet):
+		""" load_sheet(filename) loads a sheet, usually Program.load_png """
+		index_file = open(index_path)
+		try:
+			index = json.load(index_file)
+		finally:
+			index_file.close()
+
+		self.directory = os.path.dirname(os.path.abspath(index_path))
+		self.sheets = [load_sheet(os.path.join(self.directory, name)) for name in index["sheets"]]
+		self.rects = {}
+		for name, (sheet, x, y, width, height) in index["sprites"].iteritems():
+			self.rects[os.path.join(self.directory, name)] = (sheet, pygame.Rect(x, y, width, height))
+		self.graphs = {}
+
+
+	def __contains__(self, filename):
+		return os.path.abspath(filename) in self.rects
+
+
+	def get(self, filename):
+		"""
+		Returns the subsurface for the file, or None if the atlas doesn't
+		have it. The same one every time, so caches keyed by graph still hit.
+		"""
+		filename = os.path.abspath(filename)
+		graph = self.graphs.get(filename)
+		if graph == None:
+			found = self.rects.get(filename)
+			if found == None:
+				return None
+			sheet, rect = found
+			graph = self.graphs[filename] = self.sheets[sheet].subsurface(rect)
+		return graph
+
+
+	def bytes(self):
+		return sum(sheet.get_pitch() * sheet.get_height() for sheet in self.sheets)
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description = "Packs the small pngs in a directory into atlas sheets")
+	parser.add_argument("source", help = "directory of pngs")
+	parser.add_argument("output", help = "path and name for the sheets and index, without extension")
+	parser.add_argument("--sheet-size", type = int, default = 1024, help = "largest sheet width and height")
+	parser.add_argument("--max-sprite", type = int, default = 512, help = "leave out images bigger than this on either side")
+	parser.add_argument("--padding", type = int, default = 1, help = "pixels left between sprites")
+	args = parser.parse_args()
+
+	pygame.init()
+	index = build(args.source, args.output, args.sheet_size, args.max_sprite, args.padding)
+	print "%d sprites on %d sheets" % (len(index["sprites"]), len(index["sheets"]))
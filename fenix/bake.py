@@ -0,0 +1,255 @@
+"""
+Baked assets: images and sounds saved already decoded, in the formats the
+display and mixer use, so loading them is a memory map instead of a png
+decode and convert_alpha or a wav parse.
+
+Program.set_baked_assets turns it on, after which load_png and load_wav
+bake whatever they load into the directory given, and read it back from
+there next time. To bake everything up front, run
+
+	python -m fenix.bake ~/.cache/aliens/baked gfx sounds
+
+with the same display depth the game uses. A baked file is thrown away
+when its source changes, going by modification time and then by hash,
+or when the display or mixer format isn't the one it was baked for.
+"""
+
+import os
+import sys
+import json
+import mmap
+import hashlib
+import argparse
+
+import pygame
+
+
+# Ways frombuffer can lay out pixels, tried in case one matches the display
+BUFFER_FORMATS = ("RGBA", "ARGB")
+
+
+def cache_directory(name):
+	"""
+	Returns a directory for name's baked files where the user can write,
+	under ~/Library/Caches on OS X, %LOCALAPPDATA% on Windows and
+	$XDG_CACHE_HOME or ~/.cache elsewhere
+	"""
+	if sys.platform == "darwin":
+		base = os.path.expanduser("~/Library/Caches")
+	elif os.name == "nt":
+		base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+	else:
+		base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+	return os.path.join(base, name, "baked")
+
+
+def file_hash(path):
+	digest = hashlib.md5()
+	source = open(path, "rb")
+	try:
+		for block in iter(lambda: source.read(65536), ""):
+			digest.update(block)
+	finally:
+		source.close()
+	return digest.hexdigest()
+
+
+class BakedAssets(object):
+	""" Reads and writes baked files in directory. Has to be made on the
+	main thread once the display is set, reading is fine from any thread.
+	Making one, bake, bake_image and bake_sound raise OSError or IOError
+	when the directory can't be written to. """
+
+	def __init__(self, directory):
+		self.directory = directory
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+
+		# what convert_alpha makes on this display
+		self.reference = pygame.Surface((1, 1), pygame.SRCALPHA, 32).convert_alpha()
+		self.image_format = [self.reference.get_bitsize()] + list(self.reference.get_masks())
+		self.buffer_format = None
+		for name in BUFFER_FORMATS:
+			surface = pygame.image.frombuffer(bytearray(4), (1, 1), name)
+			if surface.get_masks() == self.reference.get_masks():
+				self.buffer_format = name
+
+		# sources read from baked files, which don't need baking again
+		self.loaded = set()
+		self.hits = 0
+		self.misses = 0
+
+
+	def baked_path(self, path, kind):
+		name = hashlib.md5(path).hexdigest()[:12] + "-" + os.path.basename(path)
+		return os.path.join(self.directory, name + "." + kind)
+
+
+	def map(self, path, kind, media_format):
+		"""
+		Returns the header and a copy on write mapping of the baked file for
+		path, or (None, None) if there isn't an up to date one.
+		"""
+		path = os.path.abspath(path)
+		baked_path = self.baked_path(path, kind)
+		try:
+			baked = open(baked_path, "rb")
+		except IOError:
+			self.misses += 1
+			return None, None
+
+		try:
+			header_line = baked.readline()
+			header = json.loads(header_line)
+			source = os.stat(path)
+			if header["format"] != media_format:
+				self.misses += 1
+				return None, None
+
+			if header["mtime"] != source.st_mtime or header["size"] != source.st_size:
+				# touched or checked out again, but maybe not changed
+				if header["md5"] != file_hash(path):
+					self.misses += 1
+					return None, None
+				header["mtime"] = source.st_mtime
+				header["size"] = source.st_size
+				baked.seek(len(header_line))
+				self.write(baked_path, header, baked.read())
+				header_line = json.dumps(header) + "\n"
+				baked.close()
+				baked = open(baked_path, "rb")
+
+			mapped = mmap.mmap(baked.fileno(), 0, access = mmap.ACCESS_COPY)
+		except (ValueError, KeyError, OSError, EnvironmentError):
+			self.misses += 1
+			return None, None
+		finally:
+			baked.close()
+
+		header["offset"] = len(header_line)
+		self.loaded.add(path)
+		self.hits += 1
+		return header, mapped
+
+
+	def write(self, baked_path, header, data):
+		# written beside the old one and renamed over it, so anything still
+		# mapping the old file keeps its pixels
+		temporary = baked_path + ".tmp"
+		baked = open(temporary, "wb")
+		try:
+			baked.write(json.dumps(header) + "\n")
+			baked.write(data)
+		finally:
+			baked.close()
+		try:
+			os.rename(temporary, baked_path)
+		except OSError:
+			# windows won't rename over a file that's there already
+			if not os.path.exists(baked_path):
+				raise
+			os.remove(baked_path)
+			os.rename(temporary, baked_path)
+
+
+	def bake(self, path, kind, media_format, data, **extra):
+		path = os.path.abspath(path)
+		if path in self.loaded:
+			return
+		source = os.stat(path)
+		header = {
+			"format": media_format,
+			"mtime": source.st_mtime,
+			"size": source.st_size,
+			"md5": file_hash(path),
+		}
+		header.update(extra)
+		self.write(self.baked_path(path, kind), header, data)
+		self.loaded.add(path)
+
+
+	def is_native(self, image):
+		""" True if image is already what convert_alpha would make of it """
+		return (image.get_bitsize() == self.reference.get_bitsize() and
+			image.get_masks() == self.reference.get_masks() and
+			image.get_flags() & pygame.SRCALPHA != 0)
+
+
+	def image(self, path):
+		""" Returns the baked image for path, or None """
+		header, mapped = self.map(path, "image", self.image_format)
+		if header == None:
+			return None
+
+		size = tuple(header["dimensions"])
+		pixels = buffer(mapped, header["offset"], size[0] * size[1] * 4)
+		if self.buffer_format != None:
+			# the surface uses the mapped pixels where they are
+			return pygame.image.frombuffer(pixels, size, self.buffer_format)
+
+		image = pygame.Surface(size, 0, self.reference)
+		image.get_buffer().write(pixels, 0)
+		return image
+
+
+	def bake_image(self, path, image):
+		""" Bakes an image that's been through convert_alpha """
+		if image.get_pitch() != image.get_width() * 4:
+			return
+		self.bake(path, "image", self.image_format, image.get_buffer().raw, dimensions = list(image.get_size()))
+
+
+	def sound(self, path):
+		""" Returns the baked sound for path, or None """
+		header, mapped = self.map(path, "sound", list(pygame.mixer.get_init() or ()))
+		if header == None:
+			return None
+		return pygame.mixer.Sound(buffer = buffer(mapped, header["offset"]))
+
+
+	def bake_sound(self, path, sound):
+		self.bake(path, "sound", list(pygame.mixer.get_init() or ()), sound.get_raw())
+
+
+	def decode_png(self, path, *args):
+		""" For the background loader, reads the baked image if there is one """
+		image = self.image(path)
+		if image == None:
+			image = pygame.image.load(path)
+		return image
+
+
+	def decode_wav(self, path, *args):
+		sound = self.sound(path)
+		if sound == None:
+			sound = pygame.mixer.Sound(path)
+		return sound
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description = "Bakes images and sounds for fast loading")
+	parser.add_argument("directory", help = "where the baked files go")
+	parser.add_argument("sources", nargs = "+", help = "png and wav files, or directories of them")
+	parser.add_argument("--depth", type = int, default = 32, help = "display depth the game runs at")
+	args = parser.parse_args()
+
+	pygame.init()
+	pygame.display.set_mode((1, 1), 0, args.depth)
+	baked = BakedAssets(args.directory)
+
+	paths = []
+	for source in args.sources:
+		if os.path.isdir(source):
+			paths.extend(os.path.join(source, name) for name in sorted(os.listdir(source)))
+		else:
+			paths.append(source)
+
+	count = 0
+	for path in paths:
+		if path.endswith(".png") and baked.image(path) == None:
+			baked.bake_image(path, pygame.image.load(path).convert_alpha())
+			count += 1
+		elif path.endswith(".wav") and pygame.mixer.get_init() and baked.sound(path) == None:
+			baked.bake_sound(path, pygame.mixer.Sound(path))
+			count += 1
+	print "baked %d files into %s" % (count, args.directory)
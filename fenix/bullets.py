@@ -0,0 +1,317 @@
+"""
+Bullets by the thousand. A BulletSystem is a single process holding any
+number of bullets in numpy arrays, and moves, culls, collides and draws
+them all at once rather than running a process for each one.
+
+Needs numpy, which nothing else in fenix does. available says whether it
+could be imported, making a BulletSystem without it raises ImportError.
+"""
+
+import pygame
+from pygame.locals import *
+
+from locals import *
+import program
+from process import Process
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+available = numpy != None
+
+
+def sweep(low, high, other_low, other_high):
+	"""
+	For every span from low to high, finds the other spans it could overlap
+	along one axis. Returns the order sorting other_low, and where in it
+	each span's candidates start and how many there are.
+	"""
+	order = numpy.argsort(other_low)
+	sorted_low = other_low[order]
+	# the others starting from the widest one's width before low up to high
+	widest = (other_high - other_low).max()
+	starts = numpy.searchsorted(sorted_low, low - widest, "right")
+	ends = numpy.searchsorted(sorted_low, high, "left")
+	return order, starts, numpy.maximum(ends - starts, 0)
+
+
+def overlapping(bounds, other_bounds):
+	"""
+	Returns the indices of every pair of overlapping rects, given as the
+	left, top, right and bottom arrays bounds returns, as two arrays. It
+	sweeps along whichever axis has fewer pairs overlapping on it, and only
+	tests those rather than every pair.
+	"""
+	left, top, right, bottom = bounds
+	other_left, other_top, other_right, other_bottom = other_bounds
+
+	order, starts, lengths = sweep(left, right, other_left, other_right)
+	by_y = sweep(top, bottom, other_top, other_bottom)
+	if by_y[2].sum() < lengths.sum():
+		order, starts, lengths = by_y
+
+	total = int(lengths.sum())
+	if total == 0:
+		return numpy.zeros(0, int), numpy.zeros(0, int)
+
+	indices = numpy.repeat(numpy.arange(len(left)), lengths)
+	offsets = numpy.arange(total) - numpy.repeat(numpy.cumsum(lengths) - lengths, lengths)
+	other_indices = order[numpy.repeat(starts, lengths) + offsets]
+
+	hit = ((right[indices] > other_left[other_indices]) & (left[indices] < other_right[other_indices]) &
+		(bottom[indices] > other_top[other_indices]) & (top[indices] < other_bottom[other_indices]))
+	return indices[hit], other_indices[hit]
+
+
+class BulletSystem(Process):
+	"""
+	Bullets added with fire, each a graph centred on a position that moves
+	by a fixed speed every frame, until its life runs out or it leaves the
+	system's region. Positions are screen coordinates.
+
+	Like a process, a system hits whatever has a collision_layer sharing
+	a bit with its collision_mask, other systems included, and each bullet
+	that does goes away after calling on_hit. Tests are between rects, the
+	bullet's graph against the rect the process was last drawn with, as if
+	collision_box were set.
+	"""
+
+	# bullets there's room for before the arrays have to grow
+	capacity = 256
+
+	def reset(self):
+		if numpy == None:
+			raise ImportError("BulletSystem needs numpy")
+		Process.reset(self)
+
+		self.count = 0
+		self.positions = numpy.zeros((self.capacity, 2))
+		self.speeds = numpy.zeros((self.capacity, 2))
+		# index into graphs
+		self.kinds = numpy.zeros(self.capacity, numpy.int32)
+		# frames to go, -1 for until it leaves the region
+		self.lives = numpy.zeros(self.capacity, numpy.int32)
+
+		self.graphs = []
+		self.graph_kinds = {}
+		# half the width and height of each of graphs
+		self.half_sizes = numpy.zeros((0, 2))
+		# changes whenever the bullets do, for dirty rect drawing
+		self.version = 0
+
+
+	def begin(self):
+		while True:
+			self.step()
+			yield
+
+
+	def fire(self, graph, x, y, x_speed, y_speed, life = -1):
+		"""
+		Adds a bullet drawing graph centred on x, y, moving by x_speed and
+		y_speed every frame. It lasts life frames, or until it leaves the
+		region if life is -1.
+		"""
+		kind = self.graph_kinds.get(graph)
+		if kind == None:
+			kind = self.graph_kinds[graph] = len(self.graphs)
+			self.graphs.append(graph)
+			width, height = graph.get_size()
+			self.half_sizes = numpy.vstack((self.half_sizes, (width / 2.0, height / 2.0)))
+
+		if self.count == len(self.kinds):
+			self.grow(2 * self.count)
+
+		i = self.count
+		self.positions[i] = x, y
+		self.speeds[i] = x_speed, y_speed
+		self.kinds[i] = kind
+		self.lives[i] = life
+		self.count += 1
+		self.version += 1
+
+
+	def grow(self, capacity):
+		count = self.count
+		for name in ("positions", "speeds", "kinds", "lives"):
+			old = getattr(self, name)
+			new = numpy.zeros((capacity,) + old.shape[1:], old.dtype)
+			new[:count] = old[:count]
+			setattr(self, name, new)
+
+
+	def keep(self, kept):
+		""" Drops every bullet whose entry in the boolean array kept is False """
+		if len(kept) < self.count:
+			# fired since kept was made, by on_hit
+			kept = numpy.concatenate((kept, numpy.ones(self.count - len(kept), bool)))
+		count = int(kept.sum())
+		for array in (self.positions, self.speeds, self.kinds, self.lives):
+			array[:count] = array[:self.count][kept]
+		self.count = count
+		self.version += 1
+
+
+	def clear(self):
+		self.count = 0
+		self.version += 1
+
+
+	def get_region(self):
+		if self.region == 0:
+			return program.Program.screen_rect
+		return program.Program.regions[self.region]
+
+
+	def bounds(self):
+		""" Returns the left, top, right and bottom of every bullet as arrays """
+		count = self.count
+		positions = self.positions[:count]
+		half = self.half_sizes[self.kinds[:count]]
+		low = positions - half
+		high = positions + half
+		return low[:, 0], low[:, 1], high[:, 0], high[:, 1]
+
+
+	def step(self):
+		""" Moves every bullet, drops the ones that are done with and tests the rest for hits """
+		count = self.count
+		if count == 0:
+			return
+
+		self.positions[:count] += self.speeds[:count]
+		lives = self.lives[:count]
+		lives[lives > 0] -= 1
+		self.version += 1
+
+		region = self.get_region()
+		left, top, right, bottom = self.bounds()
+		kept = ((lives != 0) &
+			(right > region.left) & (left < region.right) &
+			(bottom > region.top) & (top < region.bottom))
+		if not kept.all():
+			self.keep(kept)
+
+		if self.collision_mask:
+			self.collide()
+
+
+	def targets(self):
+		""" Returns the processes and systems this one's bullets can hit """
+		mask = self.collision_mask
+		processes = []
+		systems = []
+		for obj in program.Program.processes_priority:
+			if not getattr(obj, "collision_layer", 0) & mask or obj.status == S_SLEEP:
+				continue
+			if isinstance(obj, BulletSystem):
+				# where both can hit each other, the first made tests for both
+				if obj.count and not (obj.collision_mask & self.collision_layer and obj.id < self.id):
+					systems.append(obj)
+			elif obj.graph != None and obj.rect.width > 0 and obj.rect.height > 0:
+				processes.append(obj)
+		return processes, systems
+
+
+	def collide(self):
+		processes, systems = self.targets()
+		if not processes and not systems:
+			return
+
+		alive = numpy.ones(self.count, bool)
+
+		if processes:
+			left, top, right, bottom = self.bounds()
+			rects = numpy.array([(obj.rect.left, obj.rect.top, obj.rect.right, obj.rect.bottom) for obj in processes])
+			# bullets down, processes across
+			overlaps = ((left[:, None] < rects[:, 2]) & (right[:, None] > rects[:, 0]) &
+				(top[:, None] < rects[:, 3]) & (bottom[:, None] > rects[:, 1]))
+			for bullet, target in zip(*numpy.nonzero(overlaps)):
+				if alive[bullet] and program.Program.exists(processes[target]):
+					alive[bullet] = False
+					self.hit(bullet, processes[target])
+
+		for other in systems:
+			if not alive.any():
+				break
+			self.collide_system(other, alive)
+
+		if not alive.all():
+			self.keep(alive)
+
+
+	def collide_system(self, other, alive):
+		""" Tests this system's bullets still alive against another's, both go on a hit """
+		bullets, other_bullets = overlapping(self.bounds(), other.bounds())
+
+		other_alive = numpy.ones(other.count, bool)
+		for bullet, other_bullet in zip(bullets.tolist(), other_bullets.tolist()):
+			if alive[bullet] and other_alive[other_bullet]:
+				alive[bullet] = False
+				other_alive[other_bullet] = False
+				if self.collision_mask & other.collision_layer:
+					self.hit(bullet, other)
+				if other.collision_mask & self.collision_layer:
+					other.hit(other_bullet, self)
+
+		if not other_alive.all():
+			other.keep(other_alive)
+
+
+	def hit(self, bullet, other):
+		x, y = self.positions[bullet]
+		# so processes on_hit makes are this one's sons, whichever process is colliding
+		running = program.Program.current_process_running
+		program.Program.current_process_running = self
+		try:
+			self.on_hit(other, x, y)
+		finally:
+			program.Program.current_process_running = running
+
+
+	def on_hit(self, other, x, y):
+		"""
+		May be overidden by subclasses to react to a bullet centred on x, y
+		hitting other, a process or another BulletSystem. The bullet is gone
+		once this returns.
+		"""
+		pass
+
+
+	def draw_state(self):
+		""" Covers the area every bullet is in, which changes with each step """
+		if self.count == 0:
+			return None
+		left, top, right, bottom = self.bounds()
+		area = pygame.Rect(int(left.min()), int(top.min()), 0, 0)
+		area.width = int(right.max()) + 1 - area.left
+		area.height = int(bottom.max()) + 1 - area.top
+		return ((self.version, self.count), area.clip(self.get_region()))
+
+
+	def draw(self):
+		self.draw_dirty()
+
+
+	def draw_dirty(self, clip = None):
+		""" Blits every bullet, in one go if pygame has Surface.blits """
+		if self.count == 0:
+			return
+
+		screen = program.Program.screen
+		region = self.get_region()
+		screen.set_clip(region if clip == None else region.clip(clip))
+
+		count = self.count
+		kinds = self.kinds[:count]
+		corners = (self.positions[:count] - self.half_sizes[kinds]).astype(int).tolist()
+		graphs = self.graphs
+		blits = [(graphs[kind], corner) for kind, corner in zip(kinds.tolist(), corners)]
+
+		if hasattr(screen, "blits"):
+			screen.blits(blits, False)
+		else:
+			for graph, corner in blits:
+				screen.blit(graph, corner)
@@ -0,0 +1,87 @@
+""" Bounded caches shared between processes """
+
+from collections import OrderedDict
+
+
+def surface_bytes(surface):
+	""" Approximate memory held by a surface's pixels """
+	return surface.get_pitch() * surface.get_height()
+
+
+class LRUCache(object):
+	""" Keeps values up to a total byte budget, throwing away the least
+	recently used ones first. size_of works out the bytes of a value. """
+
+	def __init__(self, budget, size_of = surface_bytes):
+		self.budget = budget
+		self.size_of = size_of
+		self.entries = OrderedDict()
+		self.bytes = 0
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+
+	def get(self, key):
+		""" Returns the value stored under key, or None """
+		try:
+			value, size = self.entries.pop(key)
+		except KeyError:
+			self.misses += 1
+			return None
+
+		# re-inserting moves it to the most recently used end
+		self.entries[key] = (value, size)
+		self.hits += 1
+		return value
+
+
+	def __contains__(self, key):
+		""" Whether key is stored, without counting as a use of it """
+		return key in self.entries
+
+
+	def put(self, key, value):
+		""" Stores value under key, evicting old entries to stay in budget.
+		Values bigger than the whole budget are not kept. """
+		if key in self.entries:
+			self.bytes -= self.entries.pop(key)[1]
+
+		size = self.size_of(value)
+		if size > self.budget:
+			return value
+
+		self.entries[key] = (value, size)
+		self.bytes += size
+
+		while self.bytes > self.budget:
+			old_key, (old_value, old_size) = self.entries.popitem(last = False)
+			self.bytes -= old_size
+			self.evictions += 1
+
+		return value
+
+
+	def set_budget(self, budget):
+		self.budget = budget
+		while self.bytes > self.budget and self.entries:
+			old_key, (old_value, old_size) = self.entries.popitem(last = False)
+			self.bytes -= old_size
+			self.evictions += 1
+
+
+	def clear(self):
+		self.entries.clear()
+		self.bytes = 0
+
+
+	def stats(self):
+		""" Returns a dictionary of counters, handy for tuning the budget """
+		return {
+			"entries": len(self.entries),
+			"bytes": self.bytes,
+			"budget": self.budget,
+			"hits": self.hits,
+			"misses": self.misses,
+			"evictions": self.evictions,
+		}
@@ -0,0 +1,101 @@
+""" Decodes files on worker threads so loading doesn't stall the frame """
+
+import threading
+from Queue import Queue, Empty
+from timeit import default_timer
+
+import pygame
+
+
+def decode_png(path, *args):
+	return pygame.image.load(path)
+
+
+def decode_wav(path, *args):
+	return pygame.mixer.Sound(path)
+
+
+DECODERS = {
+	"png": decode_png,
+	"wav": decode_wav,
+}
+
+
+class BackgroundLoader(object):
+	""" Hands files to a pool of worker threads to decode. Anything that has
+	to happen on the main thread, like convert_alpha, is left to the finish
+	function passed to update, which runs on the main thread. Requests are
+	grouped by scope so callers can wait for a whole level's files. """
+
+	def __init__(self, workers = 2):
+		self.workers = workers
+		# kind -> function(path, *args) decoding the file, run on a worker
+		self.decoders = dict(DECODERS)
+		self.threads = []
+		self.requests = Queue()
+		self.decoded = Queue()
+		# key -> scopes waiting for it, and scope -> keys still outstanding
+		self.in_flight = {}
+		self.outstanding = {}
+
+
+	def start(self):
+		while len(self.threads) < self.workers:
+			thread = threading.Thread(target = self.work, name = "fenix loader")
+			thread.daemon = True
+			thread.start()
+			self.threads.append(thread)
+
+
+	def work(self):
+		while True:
+			key = self.requests.get()
+			kind, path, args = key[0], key[1], key[2:]
+			try:
+				self.decoded.put((key, self.decoders[kind](path, *args), None))
+			except Exception, error:
+				self.decoded.put((key, None, error))
+
+
+	def request(self, scope, key):
+		""" Queues key, a (kind, path, arguments...) tuple, to be decoded for scope """
+		self.outstanding.setdefault(scope, set()).add(key)
+		if key in self.in_flight:
+			self.in_flight[key].add(scope)
+			return
+		self.in_flight[key] = set([scope])
+		self.start()
+		self.requests.put(key)
+
+
+	def busy(self):
+		return len(self.in_flight) > 0
+
+
+	def ready(self, scope):
+		""" True once everything requested for scope has been finished """
+		return not self.outstanding.get(scope)
+
+
+	def update(self, finish, budget = 0.004):
+		""" Calls finish(scopes, key, decoded, error) on the main thread for
+		decoded files, until budget seconds have gone """
+		start = default_timer()
+		while default_timer() - start < budget:
+			try:
+				self.complete(finish, *self.decoded.get_nowait())
+			except Empty:
+				return
+
+
+	def wait(self, scope, finish):
+		""" Like update, but blocks until everything for scope is finished """
+		while not self.ready(scope):
+			self.complete(finish, *self.decoded.get())
+
+
+	def complete(self, finish, key, decoded, error):
+		scopes = self.in_flight.pop(key)
+		for scope in scopes:
+			self.outstanding[scope].discard(key)
+		finish(scopes, key, decoded, error)
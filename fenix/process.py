@@ -2,13 +2,23 @@ import os
 import pygame
 from pygame.locals import *
 import math
+from operator import attrgetter
 
 from locals import *
 
 import program
+from trig import FIXED_BITS, FIXED_ONE
 
 
-class Process(object):
+class BaseProcess(object):
+	"""
+	Everything a process does, shared by Process and CompactProcess. Its
+	__slots__ is empty so CompactProcess can do without a __dict__, which
+	only works while every class it comes from has __slots__. Make
+	processes from one of the two, and check for either with BaseProcess.
+	"""
+
+	__slots__ = ()
 
 	_graph = None
 	_size = 100
@@ -17,10 +27,75 @@ class Process(object):
 	_alpha = 255
 	_z = 0
 	_priority = 0
+	_static = False
+	
+	# Bit flags for Program.resolve_collisions, see on_collision
+	collision_layer = 0
+	collision_mask = 0
+	collision_box = False
+
+	# Position before the last logic step, used by interpolated fixed timestep
+	# drawing. Set them to x and y after a jump to stop it being smeared.
+	prev_x = None
+	prev_y = None
+	
+	# How many killed instances to keep for Program.spawn to start over
+	# rather than making new ones. Good for bullets and other things that
+	# come and go by the dozen. A pooled process's begin has to set up every
+	# attribute it uses, and nothing should hold on to one after it dies.
+	pool_size = 0
+	
+	# What transform_graph_cached was made from
+	transform_key = None
+	
+	# Draws rotated graphs at the nearest of this many angles around the
+	# circle, rather than the exact angle, so every process turning the same
+	# graph shares a few frames in the transform cache instead of making a
+	# new rotation whenever its angle changes. 0 draws at the exact angle.
+	# Program.prerender_rotations makes the frames up front.
+	rotation_steps = 0
 	
 
 	def __init__(self, *args, **kargs):
 
+		self.reset()
+		
+		# Start program if we haven't
+		if program.Program.running == False:
+			program.Program.init_game()
+		
+		# add the processes
+		self.id = program.Program.add_process(self)		   
+
+		self.status = 0
+		self.rect = pygame.Rect(0, 0, 0, 0)
+
+		self.gen = self.begin(*args, **kargs)
+		
+		# Start off the process loop if we haven't
+		if program.Program.running == False:
+			program.Program.running = True
+			program.Program.start_game()
+
+	@classmethod
+	def spawn(cls, *args, **kargs):
+		""" Makes a process like cls(*args, **kargs) would, reusing a dead one if pooled """
+		return program.Program.spawn(cls, *args, **kargs)
+
+	def revive(self, *args, **kargs):
+		""" Starts a pooled process over, see Program.spawn """
+		# dead processes are in no draw or run order, nothing to mark
+		self._z = 0
+		self._priority = 0
+		self._static = False
+		self.prev_x = self.prev_y = None
+		self.reset()
+		self.id = program.Program.add_process(self)
+		self.status = 0
+		self.rect = pygame.Rect(0, 0, 0, 0)
+		self.gen = self.begin(*args, **kargs)
+
+	def reset(self):
 		# Stuff to be referenced
 		self.x = 0
 		self.y = 0
@@ -38,26 +113,16 @@ class Process(object):
 		self.bigbro = None
 		self.special_flags = 0
 		self.redraw_transform_graph = True
+		self.redraw_mask = True
+		self.mask = None
+		# where fixed_advance last put it, its fixed point position is fixed_x, fixed_y
+		self.fixed_position = None
 
 		self.ctype = C_SCREEN
 		self.scroll_id = 0
-		
-		# Start program if we haven't
-		if program.Program.running == False:
-			program.Program.init_game()
-		
-		# add the processes
-		self.id = program.Program.add_process(self)		   
-
-		self.status = 0
-		self.rect = pygame.Rect(0, 0, 0, 0)
 
-		self.gen = self.begin(*args, **kargs)
-		
-		# Start off the process loop if we haven't
-		if program.Program.running == False:
-			program.Program.running = True
-			program.Program.start_game()
+	# The getters are here to be called, the properties read the attribute
+	# straight through attrgetter to save a python call per read
 
 	def get_graph(self):
 		return self._graph
@@ -65,8 +130,11 @@ class Process(object):
 		# mark for graph redraw if value changed
 		if self._graph != value:
 			self.redraw_transform_graph = True
+			self.redraw_mask = True
+			if self._static:
+				program.Program.static_changed(self)
 		self._graph = value		
-	graph = property(get_graph,set_graph)
+	graph = property(attrgetter("_graph"), set_graph)
 		
 	def get_size(self):
 		return self._size
@@ -74,8 +142,11 @@ class Process(object):
 		# mark for graph redraw if value changed
 		if self._size != value:
 			self.redraw_transform_graph = True
+			self.redraw_mask = True
+			if self._static:
+				program.Program.static_changed(self)
 		self._size = value
-	size = property(get_size,set_size)
+	size = property(attrgetter("_size"), set_size)
 		
 	def get_angle(self):
 		return self._angle	
@@ -83,8 +154,11 @@ class Process(object):
 		# mark for graph redraw if value changed
 		if self._angle != value:
 			self.redraw_transform_graph = True
+			self.redraw_mask = True
+			if self._static:
+				program.Program.static_changed(self)
 		self._angle = value
-	angle = property(get_angle,set_angle)
+	angle = property(attrgetter("_angle"), set_angle)
 			
 	def get_flags(self):
 		return self._flags	
@@ -92,8 +166,11 @@ class Process(object):
 		# mark for graph redraw if value changed
 		if self._flags != value:
 			self.redraw_transform_graph = True
+			self.redraw_mask = True
+			if self._static:
+				program.Program.static_changed(self)
 		self._flags = value
-	flags = property(get_flags,set_flags)
+	flags = property(attrgetter("_flags"), set_flags)
 			
 	def get_alpha(self):
 		return self._alpha	
@@ -101,26 +178,41 @@ class Process(object):
 		# mark for graph redraw if value changed
 		if self._alpha != value:
 			self.redraw_transform_graph = True
+			if self._static:
+				program.Program.static_changed(self)
 		self._alpha = value
-	alpha = property(get_alpha,set_alpha)
+	alpha = property(attrgetter("_alpha"), set_alpha)
 			
 	def get_z(self):
 		return self._z	
 	def set_z(self,value):
-		# mark z order dirty if value changed
-		if self._z != value:
+		# mark z order dirty if value changed, unless it's yet to be put in place
+		if self._z != value and self not in program.Program.z_pending:
 			program.Program.z_order_dirty = True
+			if self._static:
+				# move over to the layer for the new z
+				program.Program.remove_static(self)
+				self._z = value
+				program.Program.add_static(self)
 		self._z = value
-	z = property(get_z,set_z)
+	z = property(attrgetter("_z"), set_z)
+	
+	def get_static(self):
+		return self._static
+	def set_static(self,value):
+		# static processes are drawn once onto a layer shared by their z,
+		# setting it again refreshes the layer after moving the process
+		program.Program.set_static(self, value)
+	static = property(attrgetter("_static"), set_static)
 		
 	def get_priority(self):
 		return self._priority	
 	def set_priority(self,value):
-		# mark priority order dirty if value changed
-		if self._priority != value:
+		# mark priority order dirty if value changed, unless it's yet to be put in place
+		if self._priority != value and self not in program.Program.priority_pending:
 			program.Program.priority_order_dirty = True
 		self._priority = value
-	priority = property(get_priority,set_priority)
+	priority = property(attrgetter("_priority"), set_priority)
 		
 	
 	def begin(self):
@@ -143,17 +235,20 @@ class Process(object):
 		if self.graph == None:
 			return
 		
+		position = self.prepare_draw()
+		if position != None:
+			self.blit(position)
+
+	def prepare_draw(self):
+		""" Works out the graphic to draw and updates rect. Returns the position 
+		to blit at, or None if the process can't be seen. """
+		
 		self.graph_size = self.graph.get_size()
 		
 		self.transform_graph = self.get_real_surface()
 		center = self.transform_graph.get_size()
 
 		self.rect = pygame.Rect(self.x - (center[0]/2), self.y - (center[1]/2), center[0], center[1])
-				
-		if self.region == 0:
-			program.Program.screen.set_clip(program.Program.screen_rect)
-		else:
-			program.Program.screen.set_clip(program.Program.regions[self.region])
 		
 		x, y = self.x, self.y 
 		
@@ -161,9 +256,54 @@ class Process(object):
 			if self.scroll_id in program.Program.scroll:
 				x,y = self.calculate_scroll_draw_pos(x,y)
 			else:
-				return
+				return None
+		
+		return self.get_draw_position(x, y)
+
+	def blit(self, position, clip = None, surface = None):
+		""" Puts the prepared graphic on screen, optionally only inside clip.
+		Can be pointed at another screen sized surface instead. """
+		
+		if surface == None:
+			surface = program.Program.screen
+		
+		if self.region == 0:
+			region = program.Program.screen_rect
+		else:
+			region = program.Program.regions[self.region]
+		
+		if clip != None:
+			region = region.clip(clip)
+		
+		surface.set_clip(region)
+		surface.blit(self.transform_graph, position, None, self.special_flags)
+
+	def draw_state(self):
+		""" Used for dirty rect drawing. Prepares the draw and returns a tuple of
+		something that changes whenever the drawn image would, and the part of 
+		the screen it covers. Returns None if nothing would be drawn. """
+		
+		if self.graph == None:
+			return None
+		
+		position = self.prepare_draw()
+		if position == None:
+			return None
+		
+		self.draw_position = position
+		
+		if self.region == 0:
+			region = program.Program.screen_rect
+		else:
+			region = program.Program.regions[self.region]
 		
-		program.Program.screen.blit(self.transform_graph, self.get_draw_position(x, y), None, self.special_flags)
+		area = self.transform_graph.get_rect(topleft = position).clip(region)
+		
+		return ((self.transform_graph, position, self.special_flags, self.region), area)
+
+	def draw_dirty(self, clip = None):
+		""" Blits the graphic prepared by draw_state, optionally only inside clip """
+		self.blit(self.draw_position, clip)
 
 	def calculate_scroll_draw_pos(self, x, y):
 		return (x-program.Program.scroll[self.scroll_id].x0,
@@ -182,37 +322,56 @@ class Process(object):
 		elif self.redraw_transform_graph == False:
 			return self.transform_graph_cached
 
-		graph_size = self.graph.get_size()		
-		transform_graph = self.graph.copy()
-
-		if self.size != 100:
-			if self.size < 0: self.size = 0
-			new_width = int(graph_size[0] * (self.size / 100.0))
-			new_height = int(graph_size[1] * (self.size / 100.0))
-			transform_graph = pygame.transform.scale(transform_graph, (new_width, new_height))
-			
-		if self.angle != 0:
-			transform_graph = pygame.transform.rotate(transform_graph, self.angle / 1000)
-			
-		if self.flags != 0:
-			transform_graph = pygame.transform.flip(transform_graph, (True if self.flags & B_HMIRROR else False), (True if self.flags & B_VMIRROR else False))
+		if self.size < 0: self.size = 0
+		
+		# Processes drawing the same graph the same way share one surface
+		angle = self.drawn_angle()
+		key = (self.graph, self.size, angle, self.flags, self.alpha)
+		if key == self.transform_key:
+			# changed and back again, or pooled and spawned again the same
+			transform_graph = self.transform_graph_cached
+		elif angle == 0 and self.size == 100 and self.flags == 0 and self.alpha >= 255:
+			# turned less than half a rotation step
+			transform_graph = self.graph
+		else:
+			transform_graph = program.Program.transform_cache.get(key)
+			if transform_graph == None:
+				transform_graph = program.Program.transform_cache.put(key,
+					program.Program.transform_surface(self.graph, self.size, angle, self.flags, self.alpha))
 
 		self.special_flags = 0
 
 		if self.flags & B_ABLEND:
 			self.special_flags = BLEND_ADD
-			
-		if self.flags & B_TRANSLUCENT:
-			transform_graph.set_alpha(int(round(255/2)))
-		else:
-			transform_graph.set_alpha(self.alpha)
 
 		self.transform_graph_cached = transform_graph
+		self.transform_key = key
 		self.redraw_transform_graph = False
 		
 		return transform_graph
 	
 
+	def drawn_angle(self):
+		""" Returns the angle the graph is drawn at, see rotation_steps """
+		if self.rotation_steps and self.angle:
+			return program.Program.quantize_angle(self.angle, self.rotation_steps)
+		return self.angle
+	
+
+	def get_mask(self):
+		""" Returns the collision mask of the graphic as get_real_surface would draw it.
+		Masks are shared between processes drawing the same graph the same way. """
+		
+		if self.redraw_mask == False:
+			return self.mask
+		
+		self.mask = program.Program.get_mask(
+			(self.graph, self.size, self.drawn_angle(), self.flags), self.get_real_surface())
+		self.redraw_mask = False
+		
+		return self.mask
+	
+
 	def point_collision(self, point, box = False):
 		""" 
 		super fast collision check, will only check against a single point - a tuple of x,y
@@ -233,12 +392,10 @@ class Process(object):
 			TODO: this check could be avoided if self.rect was guaranteed to be 
 			the same size as the surface. It appears to be a pixel out sometimes.
 			"""
-			surface = self.get_real_surface() 
-			if point[0]<surface.get_width() and point[1]<surface.get_height():
-				if self.get_real_surface().get_at(point) == (255, 0, 255, 255):
-					return False				
-				else:
-					return True
+			mask = self.get_mask()
+			size = mask.get_size()
+			if point[0]<size[0] and point[1]<size[1]:
+				return True if mask.get_at(point) else False
 			else:
 				return False			
 		else:
@@ -249,17 +406,16 @@ class Process(object):
 		""" Check for collision with other object.
 			Will accept a process instance or an ID number to check against one,
 			or a process type as a string to check for all of a specific type
+			(including subclasses of it).
 			It return False if none found, or a reference to the object that was collided with."""
 			  
 		if type(other) == type(""):
 
-			# TODO: Ouch. Maybe hash by process type name?
-			for obj in program.Program.processes:
-				if obj != self.id:
-					if program.Program.processes[obj].__class__.__name__ == other:					
-						check = self.single_object_collision(program.Program.processes[obj], box)
-						if check != False:
-							return check
+			for obj in program.Program.collision_candidates(self.rect, other):
+				if obj is not self:
+					check = self.single_object_collision(obj, box)
+					if check != False:
+						return check
 				
 			return False
 
@@ -282,6 +438,9 @@ class Process(object):
 	def single_object_collision(self, other, box):
 		""" Copy paste saving function used for collision() """
 		
+		if program.Program.frame_timer != None:
+			program.Program.frame_timer.count("collision tests")
+		
 		# First check for box collisions - fast and easy
 		if self.rect.colliderect(other.rect):
 			
@@ -289,8 +448,8 @@ class Process(object):
 				return True
 			
 			# if we have box collisioning, we can try pixel-perfect
-			mymask = pygame.mask.from_surface(self.get_real_surface())
-			othermask = pygame.mask.from_surface(other.get_real_surface())
+			mymask = self.get_mask()
+			othermask = other.get_mask()
 			
 			mycenter = mymask.get_size()
 			othercenter = othermask.get_size()
@@ -347,8 +506,39 @@ class Process(object):
 
 	def xadvance(self, angle, distance):
 		""" Process will move along the defined angle x number of pixels """
+		trig = program.Program.trig
+		if trig != None:
+			index = int((angle + trig.half) // trig.resolution) % trig.size
+			self.x += int(distance * trig.cos_table[index])
+			self.y -= int(distance * trig.sin_table[index])
+			return
 		self.x += int(distance * math.cos(math.radians(angle/1000.0)))
 		self.y -= int(distance * math.sin(math.radians(angle/1000.0)))
+
+
+	def fixed_advance(self, distance, angle = None):
+		"""
+		Moves forward like advance, along angle if given, but keeps the part
+		of a pixel advance would drop for the next move. Works in fixed point
+		whole numbers so replays come out the same everywhere. distance is
+		rounded to 1/FIXED_ONE of a pixel. Needs Program.set_trig_tables.
+		"""
+		trig = program.Program.trig
+		if trig == None:
+			raise RuntimeError("fixed_advance needs lookup tables, call Program.set_trig_tables first")
+		index = trig.index(self.angle if angle == None else angle)
+		
+		# start again from where it is if something else moved it
+		if self.fixed_position != (self.x, self.y):
+			self.fixed_x = int(self.x) << FIXED_BITS
+			self.fixed_y = int(self.y) << FIXED_BITS
+		
+		step = int(round(distance * FIXED_ONE))
+		self.fixed_x += (step * trig.fixed_cos_table[index]) >> FIXED_BITS
+		self.fixed_y -= (step * trig.fixed_sin_table[index]) >> FIXED_BITS
+		self.x = self.fixed_x >> FIXED_BITS
+		self.y = self.fixed_y >> FIXED_BITS
+		self.fixed_position = (self.x, self.y)
 		
 		
 	def get_angle(self, process):
@@ -380,6 +570,15 @@ class Process(object):
 		if name == "priority": program.Program.priority_order_dirty = True
 	"""
 	
+	def on_collision(self, other):
+		"""
+		May be overidden by subclasses to react to collisions. This method is
+		called by Program once per frame, after every process has run its
+		code, for each process it touches whose collision_layer shares a bit
+		with this process's collision_mask.
+		"""
+		pass
+	
 	def on_exit(self):
 		"""
 		May be overidden by subclasses to perform cleanup operations. This method
@@ -388,6 +587,54 @@ class Process(object):
 		"""
 		pass
 	
+class Process(BaseProcess):
+	"""
+	A process keeping its attributes in a __dict__, like any other object.
+	Game processes subclass this, or CompactProcess when there are many.
+	"""
+
+
+class CompactProcess(BaseProcess):
+	"""
+	A process that keeps its attributes in slots rather than a __dict__,
+	for things there are hundreds or thousands of at once, like bullets.
+	Each one takes less memory and its attributes are quicker to get at.
+	A subclass has to name the attributes it adds in its own __slots__,
+	or it gets a __dict__ for them after all. One adding none should
+	say __slots__ = (). It isn't a Process subclass, but is filed under
+	Process for lookups by type all the same.
+	"""
+
+	__slots__ = (
+		# where it is and how it looks
+		"x", "y", "prev_x", "prev_y", "region", "ctype", "scroll_id",
+		"fixed_x", "fixed_y", "fixed_position",
+		"_graph", "_size", "_angle", "_flags", "_alpha", "_z", "_priority", "_static",
+		# family
+		"father", "son", "smallbro", "bigbro",
+		# running
+		"id", "status", "gen",
+		# worked out when drawing and colliding
+		"rect", "special_flags", "graph_size", "transform_graph", "transform_graph_cached",
+		"transform_key", "draw_position", "redraw_transform_graph", "redraw_mask", "mask",
+	)
+
+	def reset(self):
+		# slots have no class attributes to fall back on
+		self._graph = None
+		self._size = 100
+		self._angle = 0
+		self._flags = 0
+		self._alpha = 255
+		self._z = 0
+		self._priority = 0
+		self._static = False
+		self.prev_x = None
+		self.prev_y = None
+		self.transform_key = None
+		BaseProcess.reset(self)
+
+
 # ---------------------------------------------------------------------------------------
 #  Testing
 # ---------------------------------------------------------------------------------------
@@ -0,0 +1,202 @@
+""" Frame timing used for benchmarks and profiling """
+
+from collections import deque
+from timeit import default_timer
+
+import pygame
+
+
+# The parts of Program.start_game that get timed, in order
+PHASES = ("poll", "zsort", "draw", "psort", "logic", "collide", "tick", "overlay", "flip")
+
+
+def percentile(ordered, fraction):
+	""" Nearest rank percentile of an already sorted list """
+	if not ordered:
+		return 0.0
+	index = int(round(fraction * (len(ordered) - 1)))
+	return ordered[index]
+
+
+def describe(samples):
+	""" Returns the mean and p50/p95/p99 of a list of times, in milliseconds """
+	ordered = sorted(samples)
+	count = len(ordered)
+	return {
+		"mean": 1000.0 * sum(ordered) / count if count else 0.0,
+		"p50": 1000.0 * percentile(ordered, 0.50),
+		"p95": 1000.0 * percentile(ordered, 0.95),
+		"p99": 1000.0 * percentile(ordered, 0.99),
+		"max": 1000.0 * ordered[-1] if count else 0.0,
+	}
+
+
+class FrameTimer(object):
+	""" Records how long each phase of every frame takes. Program calls
+	start_frame, then mark after each phase, then end_frame. With by_class
+	set, draw and loop time is also added up per process class. """
+
+	def __init__(self, skip = 0, by_class = False):
+		# frames to leave out at the start, while things are still loading
+		self.skip = skip
+		self.by_class = by_class
+		self.frames = []
+		self.frame_counts = []
+		self.classes = {}
+		self.current = None
+		self.counts = {}
+		self.last = None
+
+
+	def start_frame(self):
+		self.current = {}
+		self.counts = {}
+		self.last = default_timer()
+
+
+	def mark(self, phase):
+		""" Ends a phase, charging the time since the last mark to it """
+		# the timer may have been set up part way through a frame
+		if self.current == None:
+			return
+		now = default_timer()
+		self.current[phase] = self.current.get(phase, 0.0) + now - self.last
+		self.last = now
+
+
+	def count(self, name, amount = 1):
+		""" Adds to a per frame counter, such as collision tests """
+		self.counts[name] = self.counts.get(name, 0) + amount
+
+
+	def call(self, kind, obj, method, *args):
+		""" Calls method, charging the time it takes to kind ("draw" or
+		"loop") for the class of obj. Returns what method returns. """
+		start = default_timer()
+		result = method(*args)
+		spent = default_timer() - start
+
+		name = obj.__class__.__name__
+		stats = self.classes.get(name)
+		if stats == None:
+			stats = self.classes[name] = {"draw": 0.0, "loop": 0.0, "calls": 0}
+		stats[kind] += spent
+		stats["calls"] += 1
+		return result
+
+
+	def end_frame(self):
+		if self.current == None:
+			return
+		if self.skip > 0:
+			self.skip -= 1
+			self.classes.clear()
+		else:
+			self.frames.append(self.current)
+			self.frame_counts.append(self.counts)
+		self.current = None
+
+
+	def summary(self):
+		""" Returns a dictionary of fps and frame/phase time statistics """
+		totals = [sum(frame.itervalues()) for frame in self.frames]
+		elapsed = sum(totals)
+		frame_count = len(self.frames)
+		result = {
+			"frames": frame_count,
+			"fps": frame_count / elapsed if elapsed > 0 else 0.0,
+			"frame": describe(totals),
+			"phases": {},
+			"counts": {},
+			"classes": {},
+		}
+		for phase in PHASES:
+			result["phases"][phase] = describe([frame.get(phase, 0.0) for frame in self.frames])
+
+		# counters and class times as averages per frame
+		for counts in self.frame_counts:
+			for name, amount in counts.iteritems():
+				result["counts"][name] = result["counts"].get(name, 0.0) + float(amount) / frame_count
+		for name, stats in self.classes.iteritems():
+			result["classes"][name] = {
+				"draw": 1000.0 * stats["draw"] / frame_count,
+				"loop": 1000.0 * stats["loop"] / frame_count,
+				"calls": float(stats["calls"]) / frame_count,
+			}
+		return result
+
+
+class Profiler(FrameTimer):
+	""" FrameTimer for live use. Only keeps the last window frames, and
+	sums them up into report every window frames for the overlay. """
+
+	def __init__(self, window = 30, by_class = True):
+		FrameTimer.__init__(self, 0, by_class)
+		self.window = window
+		self.frames = deque(maxlen = window)
+		self.frame_counts = deque(maxlen = window)
+		self.ended = 0
+		self.report = None
+		self.visible = False
+		self.font = None
+		self.surface = None
+
+
+	def end_frame(self):
+		if self.current == None:
+			return
+		FrameTimer.end_frame(self)
+		self.ended += 1
+		if self.ended % self.window == 0:
+			self.report = self.summary()
+			self.classes = {}
+			# the overlay gets rendered again from the new numbers
+			self.surface = None
+
+
+	def report_lines(self, class_count = 8):
+		""" Returns the report as lines of text """
+		report = self.report
+		if report == None:
+			return ["profiling..."]
+
+		frame = report["frame"]
+		lines = ["%.0f fps  frame %.2f ms  p95 %.2f  max %.2f" % (report["fps"], frame["mean"], frame["p95"], frame["max"])]
+		lines.append("  ".join("%s %.2f" % (phase, report["phases"][phase]["mean"]) for phase in PHASES))
+		for name in sorted(report["counts"]):
+			lines.append("%s: %.0f per frame" % (name, report["counts"][name]))
+
+		if report["classes"]:
+			lines.append("%-16s %7s %7s %6s" % ("class", "draw", "loop", "calls"))
+			classes = sorted(report["classes"].iteritems(), key = lambda item: item[1]["draw"] + item[1]["loop"], reverse = True)
+			for name, stats in classes[:class_count]:
+				lines.append("%-16s %7.2f %7.2f %6.0f" % (name[:16], stats["draw"], stats["loop"], stats["calls"]))
+		return lines
+
+
+	def render(self):
+		""" Renders the report onto a translucent surface """
+		if self.font == None:
+			if not pygame.font.get_init():
+				pygame.font.init()
+			self.font = pygame.font.Font(None, 18)
+
+		lines = [self.font.render(line, True, (255, 255, 255)) for line in self.report_lines()]
+		line_height = self.font.get_linesize()
+		width = max(line.get_width() for line in lines) + 8
+		height = line_height * len(lines) + 8
+
+		surface = pygame.Surface((width, height), pygame.SRCALPHA, 32)
+		surface.fill((0, 0, 0, 180))
+		for i, line in enumerate(lines):
+			surface.blit(line, (4, 4 + i * line_height))
+		return surface
+
+
+	def draw(self, screen):
+		""" Draws the overlay in the bottom left of screen, returns the rect covered """
+		if self.surface == None:
+			self.surface = self.render()
+		rect = self.surface.get_rect(bottomleft = (0, screen.get_height()))
+		screen.blit(self.surface, rect)
+		return rect
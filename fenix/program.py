@@ -1,11 +1,37 @@
+from timeit import default_timer
+from startup import StartupTimeline
+# made before pygame is imported, so the start up timeline includes it
+startup_timeline = StartupTimeline()
+
 import pygame
 import pygame.mixer
 from pygame.locals import *
 from locals import *
 import math
+import os
+import inspect
+from random import Random
 
 import process
-from process import Process
+from process import Process, BaseProcess
+from spatial import SpatialHash
+from cache import LRUCache, surface_bytes
+from profiler import Profiler
+from actions import ActionMap, NO_INPUT
+from assets import AssetCache, sound_bytes
+from loader import BackgroundLoader, DECODERS
+from atlas import Atlas
+from bake import BakedAssets
+from trig import TrigTables
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+startup_timeline.span("import", startup_timeline.start)
+
+EMPTY_BUCKET = {}
 
 def is_iterable(x):
 	try:
@@ -37,10 +63,14 @@ class Text(process.Process):
 		self.antialias = True
 		self.colour = (255,255,255)
 		self.status = 0
+		self.rendered = None
 		
 	def loop(self):
-		s = self.font.render(str(self.text), self.antialias, self.colour)
-		self.graph = s
+		# Only render again when something that shows has changed
+		rendered = (self.font, str(self.text), tuple(self.colour), self.antialias)
+		if rendered != self.rendered:
+			self.rendered = rendered
+			self.graph = Program.render_text(*rendered)
 
 	
 	def get_draw_position(self, draw_x, draw_y):   
@@ -248,6 +278,118 @@ class Fade:
 		pass
 	
 
+class StaticLayer:
+	""" Processes flagged as static are drawn once onto a surface covering
+	the part of the screen they're in, which then stands in for all of them
+	with a single blit. When that wouldn't save enough blits to be worth
+	the bigger one, the layer blits its members itself instead. There's
+	one layer per z, drawn below everything else at that z. """
+	
+	status = 0
+	# what one more blit costs, in pixels blitted
+	blit_cost = 1000
+	
+	def __init__(self, z):
+		self.z = z
+		self.members = []
+		self.dirty = True
+		self.graph = None
+		self.area = None
+		self.version = 0
+		# the members drawn and where, in drawing order
+		self.placed = []
+	
+	def add(self, process):
+		self.members.append(process)
+		self.dirty = True
+	
+	def remove(self, process):
+		self.members.remove(process)
+		self.dirty = True
+	
+	def compose(self):
+		""" Works out where every member goes, and draws them onto the layer
+		surface if one blit of that is cheaper than blitting each of them """
+		self.placed = []
+		self.area = None
+		self.graph = None
+		pixels = 0
+		for obj in sorted(self.members, key=lambda obj: obj.id):
+			if obj.status == S_SLEEP or obj.graph == None:
+				continue
+			position = obj.prepare_draw()
+			if position == None:
+				continue
+			self.placed.append((obj, position))
+			area = obj.transform_graph.get_rect(topleft = position).clip(Program.screen_rect)
+			pixels += area.width * area.height
+			self.area = area if self.area == None else self.area.union(area)
+		
+		if self.area != None:
+			self.area = self.area.clip(Program.screen_rect)
+			if pixels + (len(self.placed) - 1) * self.blit_cost > self.area.width * self.area.height:
+				self.render()
+		
+		self.version += 1
+		self.dirty = False
+	
+	def render(self):
+		""" Draws the members onto a surface the size of area, in the screen's format """
+		if self.covered():
+			self.graph = pygame.Surface(self.area.size).convert()
+		else:
+			self.graph = pygame.Surface(self.area.size, SRCALPHA, 32).convert_alpha()
+			self.graph.fill((0, 0, 0, 0))
+		
+		left, top = self.area.topleft
+		for obj, (x, y) in self.placed:
+			region = Program.screen_rect if obj.region == 0 else Program.regions[obj.region]
+			self.graph.set_clip(region.move(-left, -top))
+			self.graph.blit(obj.transform_graph, (x - left, y - top), None, obj.special_flags)
+		self.graph.set_clip(None)
+	
+	def covered(self):
+		""" Whether a member with nothing see through hides the whole area,
+		so the layer doesn't need any transparency either """
+		for obj, position in self.placed:
+			graph = obj.transform_graph
+			if (graph.get_flags() & SRCALPHA or graph.get_alpha() != None or
+				graph.get_colorkey() != None or obj.special_flags):
+				continue
+			region = Program.screen_rect if obj.region == 0 else Program.regions[obj.region]
+			if graph.get_rect(topleft = position).clip(region).contains(self.area):
+				return True
+		return False
+	
+	def draw(self):
+		if self.dirty:
+			self.compose()
+		self.draw_dirty()
+	
+	def draw_state(self):
+		if self.dirty:
+			self.compose()
+		if self.area == None:
+			return None
+		return ((self.graph, self.version), self.area)
+	
+	def draw_dirty(self, clip = None):
+		if self.area == None:
+			return
+		
+		if self.graph == None:
+			for obj, position in self.placed:
+				obj.blit(position, clip)
+			return
+		
+		area = self.area if clip == None else self.area.clip(clip)
+		Program.screen.set_clip(Program.screen_rect)
+		Program.screen.blit(self.graph, area.topleft, area.move(-self.area.left, -self.area.top))
+	
+	def on_exit(self):
+		pass
+
+
 import time			
 
 class Program:	 
@@ -259,21 +401,71 @@ class Program:
 	current_fps = 30
 	fps = 0
 	
+	headless = False
+	frame_count = 0
+	max_frames = None
+	random = Random()
+	frame_timer = None
+	input_script = None
+	profiler = None
+	profiler_key = None
+	overlay_rect = None
+	
 	processes = {}
+	processes_by_class = {}
+	class_names_cache = {}
 	processes_z = []
 	z_order_dirty = False
+	# appended since the last sort, see order_by, with a set of the same
+	# processes to ask whether one is among them
+	z_added = []
+	z_pending = set()
 	processes_priority = []
+	pools = {}
 	priority_order_dirty = False
+	priority_added = []
+	priority_pending = set()
+	priority_inserts_due = False
 	num_ids = 0
 	current_process_running = None
 	regions = {}
 	scroll = {}
+	spatial_hash = None
+	static_layers = {}
+	collision_pairs = []
+	# TrigTables the angle maths uses, see set_trig_tables
+	trig = None
+	mask_cache = {}
+	mask_cache_size = 512
+	transform_cache = LRUCache(8 * 1024 * 1024)
+	text_cache = LRUCache(1024 * 1024)
+	assets = AssetCache()
+	loader = BackgroundLoader()
+	atlases = []
+	baked_assets = None
+	# seconds per frame spent finishing background loads
+	loading_budget = 0.004
 	
 	screen = None
 	screen_rect = None
 	bg_colour = (0, 0, 0)
 	active_fade = None
 	
+	dirty_rects = False
+	dirty_threshold = 0.5
+	last_draw_states = {}
+	full_redraw = True
+	update_rects = None
+	
+	fixed_timestep = False
+	max_frame_skip = 5
+	interpolate = False
+	interpolation = 1.0
+	# most frames a second drawn while interpolating, None for no limit
+	draw_fps = 60
+	next_step_time = None
+	rects_current = False
+	
 	colorkey = (255, 0, 255)
 	
 	event_store = []
@@ -284,17 +476,37 @@ class Program:
 	
 	mouse = None
 	
+	action_map = ActionMap()
+	input = NO_INPUT
+	joystick = None
+	
 	channels = []
+	sound_enabled = True
+	
+	startup = startup_timeline
+	startup_report = False
+	lazy_init = False
 	
 	@classmethod	
 	def init_game(cls):
 		""" Initialises Pygame and starts up lots of other shizzle """
 		#pygame.mixer.pre_init(22050, -16, 8, 1024)
-		pygame.init()
+		started = default_timer()
+		if cls.lazy_init:
+			# font, mixer and joystick start when first used, see require
+			pygame.display.init()
+			cls.startup.span("pygame.display.init", started)
+		else:
+			pygame.init()
+			cls.startup.span("pygame.init", started)
 		pygame.mouse.set_visible(True)
 		pygame.key.set_repeat(10, 0)
 		
 		cls.clock = pygame.time.Clock()
+		if cls.lazy_init:
+			# pygame.init would have started SDL's timer, ticking starts it
+			# now so millis counts from start up rather than the first frame
+			cls.clock.tick()
 
 		cls.keys_pressed  = pygame.key.get_pressed()
 		
@@ -318,50 +530,331 @@ class Program:
 			
 		while cls.running:
 			
-			cls.poll_events()
+			if cls.fixed_timestep and not cls.headless:
+				cls.run_fixed_frame()
+				continue
 			
+			timer = cls.frame_timer
+			if timer != None:
+				timer.start_frame()
 			
-			#################
-			# Draw everything
-			#################			 
-			if cls.screen != None:
-				cls.screen.fill(cls.bg_colour)
-				
-			if cls.z_order_dirty == True:
-				cls.processes_z.sort(
-									  reverse=True,
-									  key=lambda object:
-										object.z if hasattr(object, "z") else 0
-									)
-				cls.z_order_dirty = False
+			cls.poll_events()
+			if timer != None:
+				timer.mark("poll")
 			
-			# Do graphics
-			for obj in cls.processes_z:
-				if obj.status != S_SLEEP:
-					obj.draw()
+			cls.draw_frame()
+			if timer != None:
+				timer.mark("draw")
 			
+			# File everything under its freshly drawn rect for collision checks
+			if cls.spatial_hash != None:
+				cls.update_spatial_hash()
+			if timer != None:
+				timer.mark("collide")
 			
-			#################
-			# Logic everything
-			#################
-			if cls.priority_order_dirty == True:
-				cls.processes_priority.sort(
-											 reverse=True,
-											 key=lambda object:
-												object.priority if hasattr(object, "priority") else 0
-											)
-				cls.priority_order_dirty = False
+			cls.logic_step()
+
+			# FPS handle
+			cls.fps = int(cls.clock.get_fps())
+			if cls.headless:
+				timerunning = cls.clock.tick()
+			else:
+				timerunning = cls.clock.tick(cls.current_fps)
+			if timer != None:
+				timer.mark("tick")
 			
+			cls.present_frame()
+		
+
+	@classmethod
+	def draw_frame(cls):
+		""" Draws every process onto the screen """
+		timer = cls.frame_timer
+		
+		cls.sort_z()
+		if timer != None:
+			timer.mark("zsort")
+		
+		# Do graphics
+		if cls.dirty_rects and cls.screen != None:
+			cls.draw_dirty()
+		else:
+			if cls.screen != None:
+				cls.screen.fill(cls.bg_colour)
+			
+			if timer != None and timer.by_class:
+				for obj in cls.processes_z:
+					if obj.status != S_SLEEP:
+						timer.call("draw", obj, obj.draw)
+			else:
+				for obj in cls.processes_z:
+					if obj.status != S_SLEEP:
+						obj.draw()
+
+
+	@classmethod
+	def logic_step(cls):
+		""" Runs one tick of every process, then resolves collisions """
+		timer = cls.frame_timer
+		
+		if cls.priority_order_dirty or cls.priority_inserts_due:
+			cls.order_by(cls.processes_priority, cls.priority_added, "priority", cls.priority_order_dirty)
+			cls.priority_order_dirty = False
+			cls.priority_inserts_due = False
+			cls.priority_added = []
+			cls.priority_pending = set()
+		if timer != None:
+			timer.mark("psort")
+		
+		if timer != None and timer.by_class:
+			for obj in cls.processes_priority:
+				if obj.status == 0 and hasattr(obj, "loop"):
+					cls.current_process_running = obj
+					timer.call("loop", obj, obj.loop)
+		else:
 			for obj in cls.processes_priority:
 				if obj.status == 0 and hasattr(obj, "loop"):
 					cls.current_process_running = obj
 					obj.loop()
+		if timer != None:
+			timer.mark("logic")
 
-			# FPS handle
-			cls.fps = int(cls.clock.get_fps())
-			timerunning = cls.clock.tick(cls.current_fps)
+		# Collide everything that asked for it
+		cls.resolve_collisions()
+		if timer != None:
+			timer.mark("collide")
+		
+		cls.frame_count += 1
+		if cls.max_frames != None and cls.frame_count >= cls.max_frames:
+			cls.running = False
+
+
+	@classmethod
+	def present_frame(cls):
+		""" Sends the drawn frame to the display """
+		timer = cls.frame_timer
+		
+		if cls.profiler != None:
+			cls.draw_profiler()
+			if timer != None:
+				timer.mark("overlay")
+		
+		started = default_timer()
+		if cls.update_rects == None:
 			pygame.display.flip()
+		else:
+			pygame.display.update(cls.update_rects)
+		
+		if not cls.startup.finished():
+			cls.startup.span("first flip", started)
+			cls.finish_startup()
+		
+		if timer != None:
+			timer.mark("flip")
+			timer.end_frame()
+
+
+	@classmethod
+	def finish_startup(cls):
+		""" Called after the first frame is shown """
+		cls.startup.finish()
+		if cls.startup_report:
+			print "\n".join(cls.startup.report_lines())
+
+
+	@classmethod
+	def run_fixed_frame(cls):
+		"""
+		One pass of the fixed timestep loop. Runs as many logic steps as are
+		due, up to max_frame_skip, then draws once. Without interpolation it
+		waits for the next step rather than drawing the same frame twice.
+		"""
+		timer = cls.frame_timer
+		# A timed frame runs until something gets drawn, taking in any
+		# steps and waiting since the last one
+		if timer != None and timer.current == None:
+			timer.start_frame()
+		
+		step_time = 1000.0 / cls.current_fps
+		now = pygame.time.get_ticks()
+		if cls.next_step_time == None:
+			cls.next_step_time = now
+		
+		steps = 0
+		while now >= cls.next_step_time and steps < cls.max_frame_skip and cls.running:
+			# Collision checks need rects at the current positions, the last
+			# draw may have been skipped or interpolated
+			if not cls.rects_current:
+				cls.prepare_rects()
+			if cls.spatial_hash != None:
+				cls.update_spatial_hash()
+			
+			if cls.interpolate:
+				for obj in cls.processes_priority:
+					if hasattr(obj, "prev_x"):
+						obj.prev_x = obj.x
+						obj.prev_y = obj.y
+			if timer != None:
+				timer.mark("collide")
+			
+			cls.poll_events()
+			if timer != None:
+				timer.mark("poll")
+			cls.logic_step()
+			cls.rects_current = False
+			
+			cls.next_step_time += step_time
+			steps += 1
+		
+		# Too far behind to catch up, let the game slow down instead
+		if now >= cls.next_step_time:
+			cls.next_step_time = now
+		
+		if not cls.running:
+			return
+		
+		if steps == 0 and not cls.interpolate:
+			pygame.time.wait(max(1, int(cls.next_step_time - now)))
+			if timer != None:
+				timer.mark("tick")
+			return
+		
+		if cls.interpolate:
+			cls.interpolation = min(1.0, max(0.0, 1.0 - (cls.next_step_time - now) / step_time))
+			cls.draw_interpolated(cls.interpolation)
+		else:
+			cls.draw_frame()
+			cls.rects_current = True
+		if timer != None:
+			timer.mark("draw")
 		
+		fps = cls.clock.get_fps()
+		# infinite when uncapped frames take under a millisecond
+		if fps != float("inf"):
+			cls.fps = int(fps)
+		if cls.interpolate and cls.draw_fps:
+			# sleeps off the rest of the frame, rather than drawing flat out
+			cls.clock.tick(cls.draw_fps)
+		else:
+			cls.clock.tick()
+		cls.present_frame()
+
+
+	@classmethod
+	def draw_interpolated(cls, interpolation):
+		""" Draws every process part way between its last two logic positions """
+		moved = []
+		for obj in cls.processes_z:
+			prev_x = getattr(obj, "prev_x", None)
+			if prev_x == None:
+				continue
+			x, y = obj.x, obj.y
+			if prev_x != x or obj.prev_y != y:
+				moved.append((obj, x, y))
+				obj.x = prev_x + (x - prev_x) * interpolation
+				obj.y = obj.prev_y + (y - obj.prev_y) * interpolation
+		
+		cls.draw_frame()
+		
+		for obj, x, y in moved:
+			obj.x = x
+			obj.y = y
+		
+		cls.rects_current = not moved
+
+
+	@classmethod
+	def prepare_rects(cls):
+		""" Works out the rects of everything drawable without drawing it """
+		for obj in cls.processes_z:
+			if obj.status != S_SLEEP and hasattr(obj, "prepare_draw") and obj.graph != None:
+				obj.prepare_draw()
+
+
+	@classmethod
+	def draw_dirty(cls):
+		"""
+		Draws the frame in dirty rect mode. Only the areas covered by things
+		that moved, changed, appeared or went away since the last frame get
+		their background restored and redrawn, and only those are queued for
+		the display update. Falls back to redrawing the whole screen when the
+		changed area is over dirty_threshold of it, or when something is
+		drawn that can't tell what area it covers (scrolls, fades).
+		"""
+		screen = cls.screen
+		full = cls.full_redraw or screen.get_flags() & DOUBLEBUF
+		timer = cls.frame_timer
+		by_class = timer != None and timer.by_class
+		
+		states = {}
+		drawables = []
+		areas = []
+		for obj in cls.processes_z:
+			if obj.status == S_SLEEP:
+				continue
+			if not hasattr(obj, "draw_state"):
+				full = True
+				drawables.append(obj)
+				areas.append(None)
+				continue
+			if by_class:
+				state = timer.call("draw", obj, obj.draw_state)
+			else:
+				state = obj.draw_state()
+			if state != None:
+				states[obj.id] = state
+				drawables.append(obj)
+				areas.append(state[1])
+		
+		if not full:
+			dirty = []
+			last = cls.last_draw_states
+			for obj_id, state in states.iteritems():
+				old = last.get(obj_id)
+				if old == None:
+					dirty.append(state[1])
+				elif old[0] != state[0]:
+					dirty.append(old[1])
+					dirty.append(state[1])
+			for obj_id, old in last.iteritems():
+				if obj_id not in states:
+					dirty.append(old[1])
+			
+			# The profiler overlay is translucent, what's under it needs restoring
+			if cls.overlay_rect != None:
+				dirty.append(cls.overlay_rect)
+			
+			dirty_area = 0
+			for rect in dirty:
+				dirty_area += rect.width * rect.height
+			if dirty_area > cls.screen_rect.width * cls.screen_rect.height * cls.dirty_threshold:
+				full = True
+		
+		# Blits leave the clip set to whatever they drew last
+		screen.set_clip(None)
+		
+		if full:
+			screen.fill(cls.bg_colour)
+			for obj, area in zip(drawables, areas):
+				if area == None:
+					obj.draw()
+				else:
+					obj.draw_dirty()
+			cls.update_rects = None
+		else:
+			# Each dirty rect is restored and redrawn on its own, so overlapping
+			# ones never get translucent pixels blended twice
+			bg_colour = cls.bg_colour
+			for rect in dirty:
+				screen.set_clip(None)
+				screen.fill(bg_colour, rect)
+				for index in rect.collidelistall(areas):
+					drawables[index].draw_dirty(rect)
+			cls.update_rects = dirty
+		
+		cls.last_draw_states = states
+		cls.full_redraw = False
+
 
 	@classmethod
 	def add_process(cls, object, is_process = True):
@@ -369,16 +862,21 @@ class Program:
 		
 		cls.num_ids = cls.num_ids + 1;
 		cls.processes[cls.num_ids] = object
+		for name in cls.class_names(object.__class__):
+			cls.processes_by_class.setdefault(name, {})[cls.num_ids] = object
 		cls.processes_z.append(object)
 		cls.processes_priority.append(object)
+		# put in place at the next sort, without sorting everything again
+		cls.z_added.append(object)
+		cls.z_pending.add(object)
+		cls.priority_added.append(object)
+		cls.priority_pending.add(object)
 
 		object.id = cls.num_ids
 		
-		cls.z_order_dirty = True
-		
 		if is_process == True:
 			
-			cls.priority_order_dirty = True
+			cls.priority_inserts_due = True
 			
 			# Handle relationships
 			if cls.current_process_running != None:
@@ -402,16 +900,119 @@ class Program:
 			return
 		
 		del cls.processes[process_id]
+		for name in cls.class_names(ref.__class__):
+			del cls.processes_by_class[name][process_id]
 
-		cls.processes_z.remove(ref)
+		if getattr(ref, "_static", False):
+			cls.remove_static(ref)
+		else:
+			cls.processes_z.remove(ref)
 		cls.processes_priority.remove(ref)
+		# taking things out leaves the rest in order, no need to sort again
+		if ref in cls.z_pending:
+			cls.z_pending.remove(ref)
+			cls.z_added.remove(ref)
+		if ref in cls.priority_pending:
+			cls.priority_pending.remove(ref)
+			cls.priority_added.remove(ref)
+
+		if cls.spatial_hash != None:
+			cls.spatial_hash.remove(ref)
 
 		ref.on_exit()
 
+		if getattr(ref, "pool_size", 0) > 0:
+			cls.recycle(ref)
+
 		del(ref)
+
+
+	@classmethod
+	def sort_z(cls):
+		""" Puts processes_z in drawing order """
+		if cls.z_order_dirty or cls.z_added:
+			cls.order_by(cls.processes_z, cls.z_added, "z", cls.z_order_dirty)
+			cls.z_order_dirty = False
+			cls.z_added = []
+			cls.z_pending = set()
+
+
+	@classmethod
+	def order_by(cls, objects, added, name, full):
+		"""
+		Sorts objects by their attribute name, highest first, the way a stable
+		sort would. When all that changed since the last sort is added being
+		appended, they're inserted into place instead, which is a lot cheaper
+		than sorting everything again with many processes about.
+		"""
+		count = len(added)
+		if not full and count > 0 and objects[-count:] != added:
+			# something else moved them, don't trust the order
+			full = True
+		
+		if full:
+			objects.sort(reverse=True, key=lambda object: getattr(object, name, 0))
+			return
+		
+		if count > 0:
+			del objects[-count:]
+		for obj in added:
+			value = getattr(obj, name, 0)
+			# after everything as high or higher, where a stable sort would leave it
+			low = 0
+			high = len(objects)
+			while low < high:
+				middle = (low + high) // 2
+				if getattr(objects[middle], name, 0) < value:
+					high = middle
+				else:
+					low = middle + 1
+			objects.insert(low, obj)
+
+
+	@classmethod
+	def spawn(cls, klass, *args, **kargs):
+		"""
+		Like klass(*args, **kargs), but starts over an instance of klass that
+		died earlier if one is waiting in its pool. See Process.pool_size.
+		"""
+		pool = cls.pools.get(klass)
+		if not pool:
+			return klass(*args, **kargs)
+		process = pool.pop()
+		process.revive(*args, **kargs)
+		return process
+
+
+	@classmethod
+	def recycle(cls, process):
+		"""
+		Keeps a killed process to be started over by spawn, if its pool has
+		room. Ones with children aren't kept, they'd lose track of them.
+		"""
+		pool = cls.pools.setdefault(process.__class__, [])
+		if len(pool) >= process.pool_size or process.son != None:
+			return
 		
-		cls.z_order_dirty = True
-		cls.priority_order_dirty = True
+		# Out of its family, so tree signals don't find it again once it's
+		# been spawned somewhere else. Its own bigbro stays for a tree signal
+		# that's part way through killing its brothers to carry on with.
+		if process.smallbro != None:
+			process.smallbro.bigbro = process.bigbro
+		if process.bigbro != None:
+			process.bigbro.smallbro = process.smallbro
+		if process.father != None and process.father.son is process:
+			process.father.son = process.bigbro
+		
+		# let go of whatever the last run was holding on to
+		process.gen = None
+		pool.append(process)
+
+
+	@classmethod
+	def clear_pools(cls):
+		""" Forgets every pooled process, along with anything they still refer to """
+		cls.pools = {}
 
 
 	@classmethod
@@ -423,6 +1024,15 @@ class Program:
 		pygame.event.pump()
 		cls.keys_pressed  = pygame.key.get_pressed()
 		
+		if cls.input_script != None:
+			keys_pressed = [0] * len(cls.keys_pressed)
+			for key_type in cls.input_script(cls.frame_count):
+				keys_pressed[key_type] = 1
+			cls.keys_pressed = keys_pressed
+		
+		# Everything reads actions from this one snapshot for the rest of the frame
+		cls.input = cls.action_map.sample(cls.keys_pressed, cls.joystick, cls.input)
+		
 		cls.mouse.pos = pygame.mouse.get_pos()
 		cls.mouse.x = cls.mouse.pos[0]
 		cls.mouse.y = cls.mouse.pos[1]
@@ -451,6 +1061,13 @@ class Program:
 		
 		cls.mouse.right = True if cls.mouse_buttons_pressed[2] else False
 		cls.mouse.right_up = True if cls.last_mouse_buttons_pressed[2] and not cls.mouse_buttons_pressed[2] else False
+		
+		if cls.profiler_key != None and cls.key_released(cls.profiler_key):
+			cls.profiler.visible = not cls.profiler.visible
+			cls.full_redraw = True
+		
+		if cls.loader.busy():
+			cls.loader.update(cls.finish_asset, cls.loading_budget)
 				
 
 	##############################################
@@ -463,10 +1080,39 @@ class Program:
 
 		if use_hardware:
 			fullscreen = fullscreen | pygame.HWSURFACE | pygame.DOUBLEBUF
-			
-		cls.screen = pygame.display.set_mode(resolution, fullscreen)
+		
+		started = default_timer()
+		if cls.headless:
+			# the dummy driver defaults to 8 bits, which spoils alpha graphics
+			cls.screen = pygame.display.set_mode(resolution, fullscreen, 32)
+		else:
+			cls.screen = pygame.display.set_mode(resolution, fullscreen)
 		cls.screen_rect = cls.screen.get_rect()
 		cls.regions[0] = cls.screen.get_rect()
+		cls.full_redraw = True
+		cls.startup.span("set_mode", started)
+
+
+	@classmethod
+	def set_lazy_init(cls, enabled = True, report = False):
+		"""
+		With lazy init on, starting up only initialises pygame's display.
+		Other modules such as font, mixer and joystick are initialised by
+		require the first time they're needed, and ones never used, like
+		cdrom, never are. With report, the start up timeline is printed
+		after the first frame. Must be called before the first process exists.
+		"""
+		cls.lazy_init = enabled
+		cls.startup_report = report
+
+
+	@classmethod
+	def require(cls, module):
+		""" Initialises a pygame module, such as pygame.mixer, if it isn't yet """
+		if not module.get_init():
+			started = default_timer()
+			module.init()
+			cls.startup.span("init " + module.__name__, started)
 	
 
 	@classmethod
@@ -475,6 +1121,133 @@ class Program:
 		pygame.display.set_caption(title_name)
 
 
+	@classmethod
+	def set_dirty_rects(cls, enabled = True, threshold = 0.5):
+		"""
+		Turns dirty rect drawing on or off. When on, only the parts of the
+		screen that changed are redrawn and sent to the display, unless they
+		add up to more than threshold (0.0 - 1.0) of the screen. Graphs that
+		are drawn on after being shown need a call to redraw_all.
+		"""
+		cls.dirty_rects = enabled
+		cls.dirty_threshold = threshold
+		cls.full_redraw = True
+		cls.update_rects = None
+
+
+	@classmethod
+	def redraw_all(cls):
+		""" Makes the next frame redraw and update the whole screen """
+		cls.full_redraw = True
+
+
+	@classmethod
+	def set_fixed_timestep(cls, enabled = True, max_frame_skip = 5, interpolate = False, draw_fps = 60):
+		"""
+		Decouples game speed from drawing speed. Logic runs at a steady
+		set_fps steps per second however long frames take to draw, with up to
+		max_frame_skip steps run between two drawn frames when behind. With
+		interpolate on, frames are drawn up to draw_fps times a second, None
+		for as often as possible, and processes are shown part way between
+		their last two positions.
+		"""
+		cls.fixed_timestep = enabled
+		cls.max_frame_skip = max(1, max_frame_skip)
+		cls.interpolate = interpolate
+		cls.draw_fps = draw_fps
+		cls.interpolation = 1.0
+		cls.next_step_time = None
+		cls.rects_current = False
+
+
+	@classmethod
+	def set_headless(cls, seed = None, max_frames = None):
+		"""
+		Runs with SDL's dummy video and audio drivers and no frame rate limit,
+		so the game goes as fast as it can without a display. Program.random
+		is seeded with seed and millis counts frames rather than real time,
+		making every run of the same input identical. Stops after max_frames
+		logic steps if given. Must be called before the first process exists.
+		"""
+		os.environ["SDL_VIDEODRIVER"] = "dummy"
+		os.environ["SDL_AUDIODRIVER"] = "dummy"
+		cls.headless = True
+		cls.max_frames = max_frames
+		cls.seed(seed)
+
+
+	@classmethod
+	def set_frame_timer(cls, timer):
+		"""
+		Hands every frame's phases to timer, a fenix.profiler.FrameTimer or
+		anything with the same methods. None turns timing off again.
+		"""
+		cls.frame_timer = timer
+
+
+	@classmethod
+	def enable_profiler(cls, hotkey = K_F12, window = 30, by_class = True):
+		"""
+		Starts timing every frame with a fenix.profiler.Profiler: each phase
+		of start_game, draw and loop time per process class unless by_class
+		is off, and collision tests. Pressing hotkey shows the numbers,
+		averaged over window frames, on top of the game.
+		"""
+		cls.profiler = Profiler(window, by_class)
+		cls.profiler_key = hotkey
+		cls.set_frame_timer(cls.profiler)
+
+
+	@classmethod
+	def disable_profiler(cls):
+		if cls.frame_timer is cls.profiler:
+			cls.set_frame_timer(None)
+		cls.profiler = None
+		cls.profiler_key = None
+		cls.full_redraw = True
+
+
+	@classmethod
+	def draw_profiler(cls):
+		""" Puts the profiler overlay on top of the finished frame """
+		if not cls.profiler.visible or cls.screen == None:
+			cls.overlay_rect = None
+			return
+		
+		cls.screen.set_clip(None)
+		cls.overlay_rect = cls.profiler.draw(cls.screen)
+		if cls.update_rects != None:
+			cls.update_rects.append(cls.overlay_rect)
+
+
+	@classmethod
+	def set_input_script(cls, script):
+		"""
+		Replaces the keyboard with script, which is called with the frame
+		number each frame and returns the keys held down on it. Used to
+		drive games without anyone at the keys. None gives the keyboard back.
+		"""
+		# kept as a staticmethod so it isn't bound to Program
+		cls.input_script = None if script == None else staticmethod(script)
+
+
+	@classmethod
+	def seed(cls, value = None):
+		""" Reseeds Program.random, which games should use for anything random """
+		cls.random.seed(value)
+
+
+	@classmethod
+	def millis(cls):
+		"""
+		Milliseconds since the game started. In headless mode this is worked
+		out from the number of logic steps run at the current fps instead.
+		"""
+		if cls.headless:
+			return cls.frame_count * 1000 / cls.current_fps
+		return pygame.time.get_ticks()
+
+
 	@classmethod
 	def set_fps(cls, fps):
 		""" Sets the frames per second to a new value. Accepts an integer. """
@@ -495,7 +1268,251 @@ class Program:
 	@classmethod		
 	def define_region(cls, region_id, x, y, w, h):
 		cls.regions[region_id] = pygame.Rect((x, y), (w, h))
+		cls.full_redraw = True
+		
+
+	##############################################
+	# STATIC LAYERS
+	##############################################
+	@classmethod
+	def set_static(cls, process, value):
+		"""
+		Moves a process onto or off the static layer for its z. Use through
+		Process.static rather than calling directly.
+		"""
+		if process.id not in cls.processes:
+			return
+		
+		if process._static:
+			cls.remove_static(process)
+			if not value:
+				cls.processes_z.append(process)
+				cls.z_order_dirty = True
+		elif value:
+			cls.processes_z.remove(process)
+			if process in cls.z_pending:
+				cls.z_pending.remove(process)
+				cls.z_added.remove(process)
+		
+		process._static = value
+		if value:
+			cls.add_static(process)
+
+
+	@classmethod
+	def add_static(cls, process):
+		layer = cls.static_layers.get(process.z)
+		if layer == None:
+			layer = cls.static_layers[process.z] = StaticLayer(process.z)
+			cls.add_process(layer, False)
+			
+			# Sit below everything already at the same z. Sorting is stable
+			# so it keeps that place among them afterwards.
+			# add_process has just appended it
+			cls.processes_z.pop()
+			cls.z_added.pop()
+			cls.z_pending.remove(layer)
+			cls.sort_z()
+			index = 0
+			for obj in cls.processes_z:
+				if obj.z <= layer.z:
+					break
+				index += 1
+			cls.processes_z.insert(index, layer)
+		
+		layer.add(process)
+
+
+	@classmethod
+	def remove_static(cls, process):
+		layer = cls.static_layers.get(process.z)
+		if layer == None:
+			return
 		
+		layer.remove(process)
+		if not layer.members:
+			del cls.static_layers[process.z]
+			cls.kill_process(layer.id)
+
+
+	@classmethod
+	def static_changed(cls, process):
+		""" Marks the layer of a static process for redrawing """
+		layer = cls.static_layers.get(process.z)
+		if layer != None:
+			layer.dirty = True
+
+
+	##############################################
+	# COLLISION BROADPHASE
+	##############################################
+	@classmethod
+	def enable_spatial_hash(cls, cell_size = 64):
+		"""
+		Makes collision checks only look at processes drawn near the checking
+		process. cell_size should be around the size of the common sprites.
+		"""
+		cls.spatial_hash = SpatialHash(cell_size)
+		cls.update_spatial_hash()
+
+
+	@classmethod
+	def disable_spatial_hash(cls):
+		cls.spatial_hash = None
+
+
+	@classmethod
+	def update_spatial_hash(cls):
+		""" Refiles every process under the rect it was last drawn with """
+		update = cls.spatial_hash.update
+		for obj in cls.processes_priority:
+			if isinstance(obj, BaseProcess):
+				update(obj)
+
+
+	@classmethod
+	def collision_candidates(cls, rect, type_name):
+		"""
+		Returns an iterable of the processes with the given type name that
+		may overlap rect. Without a spatial hash that is every one of them.
+		"""
+		bucket = cls.type_bucket(type_name)
+		if cls.spatial_hash == None:
+			return bucket.itervalues()
+
+		nearby = cls.spatial_hash.query(rect)
+		if len(nearby) >= len(bucket):
+			return bucket.itervalues()
+		return [obj for obj_id, obj in nearby.iteritems() if obj_id in bucket]
+
+
+	@classmethod
+	def point_collision(cls, point, type_name = "Process", box = False):
+		"""
+		Returns the first process of the given type found at point, or False.
+		Uses the same rules as Process.point_collision.
+		"""
+		if cls.spatial_hash == None:
+			candidates = cls.type_bucket(type_name).itervalues()
+		else:
+			bucket = cls.type_bucket(type_name)
+			candidates = [obj for obj_id, obj in cls.spatial_hash.query_point(point).iteritems() if obj_id in bucket]
+
+		for obj in candidates:
+			if obj.point_collision(point, box):
+				return obj
+		return False
+
+
+	@classmethod
+	def get_mask(cls, key, surface):
+		"""
+		Returns the collision mask of surface, which must be the graph described
+		by key once transformed. Masks are cached by key so processes drawing
+		the same graph at the same size, angle and flags share one.
+		"""
+		mask = cls.mask_cache.get(key)
+		if mask == None:
+			if len(cls.mask_cache) >= cls.mask_cache_size:
+				cls.mask_cache.clear()
+			mask = cls.mask_cache[key] = pygame.mask.from_surface(surface)
+		return mask
+
+
+	@classmethod
+	def clear_mask_cache(cls):
+		""" Forgets all cached masks, needed if a graph is drawn on after being used """
+		cls.mask_cache.clear()
+
+
+	##############################################
+	# COLLISION GROUPS
+	##############################################
+	@classmethod
+	def collision_members(cls):
+		"""
+		Returns the visible processes that have a collision layer and a graph
+		drawn at least once, these are the ones resolve_collisions looks at.
+		"""
+		members = []
+		for obj in cls.processes_priority:
+			if getattr(obj, "collision_layer", 0) and obj.status != S_SLEEP and obj.graph != None:
+				rect = obj.rect
+				if rect.width > 0 and rect.height > 0:
+					members.append(obj)
+		return members
+
+
+	@classmethod
+	def collision_broadphase(cls, members):
+		"""
+		Returns a list of (a, b) tuples of members whose rects overlap and
+		whose layers and masks are interested in each other. Each pair is
+		listed once.
+		"""
+		pairs = []
+
+		if cls.spatial_hash != None:
+			member_ids = set(obj.id for obj in members)
+			for a in members:
+				a_layer, a_mask, a_rect = a.collision_layer, a.collision_mask, a.rect
+				for b_id, b in cls.spatial_hash.query(a_rect).iteritems():
+					if b_id > a.id and b_id in member_ids:
+						if (a_mask & b.collision_layer or b.collision_mask & a_layer) and a_rect.colliderect(b.rect):
+							pairs.append((a, b))
+			return pairs
+
+		# Sweep along x, only rects that start before the current one ends can overlap it
+		members = sorted(members, key=lambda obj: obj.rect.left)
+		for i, a in enumerate(members):
+			a_layer, a_mask, a_rect = a.collision_layer, a.collision_mask, a.rect
+			right = a_rect.right
+			for b in members[i+1:]:
+				b_rect = b.rect
+				if b_rect.left >= right:
+					break
+				if (a_mask & b.collision_layer or b.collision_mask & a_layer) and a_rect.colliderect(b_rect):
+					pairs.append((a, b))
+		return pairs
+
+
+	@classmethod
+	def resolve_collisions(cls):
+		"""
+		Tests every pair of processes whose collision_mask covers the other's
+		collision_layer, once per frame. Pixel perfect unless either one has
+		collision_box set. Colliding pairs are stored in collision_pairs and
+		each process interested in the other gets on_collision(other) called.
+		"""
+		members = cls.collision_members()
+		if len(members) < 2:
+			cls.collision_pairs = []
+			return
+
+		pairs = []
+		candidates = cls.collision_broadphase(members)
+		if cls.frame_timer != None:
+			cls.frame_timer.count("collision pairs tested", len(candidates))
+		for a, b in candidates:
+			box = a.collision_box or b.collision_box
+			if a.single_object_collision(b, box) != False:
+				pairs.append((a, b))
+		cls.collision_pairs = pairs
+
+		processes = cls.processes
+		for a, b in pairs:
+			# Earlier callbacks may have killed either of them
+			if processes.get(a.id) is not a or processes.get(b.id) is not b:
+				continue
+			if a.collision_mask & b.collision_layer:
+				cls.current_process_running = a
+				a.on_collision(b)
+			if processes.get(a.id) is not a or processes.get(b.id) is not b:
+				continue
+			if b.collision_mask & a.collision_layer:
+				cls.current_process_running = b
+				b.on_collision(a)
+
 
 	##############################################
 	# SCROLLS
@@ -534,6 +1551,41 @@ class Program:
 			return False
 		
 
+	@classmethod
+	def bind_action(cls, action, keys = (), axes = (), buttons = ()):
+		"""
+		Makes action held while any of keys, joystick axes or joystick buttons
+		are. axes are (axis number, direction) tuples, direction being -1 or 1.
+		Can be called again to add more inputs to the same action.
+		"""
+		cls.action_map.bind(action, keys, axes, buttons)
+
+
+	@classmethod
+	def set_joystick(cls, joystick):
+		""" Sets the initialised pygame joystick actions are read from, or None """
+		cls.joystick = joystick
+		cls.action_map.set_joystick(joystick)
+
+
+	@classmethod
+	def action(cls, action):
+		""" Returns True if action is held down this frame """
+		return action in cls.input.held
+
+
+	@classmethod
+	def action_pressed(cls, action):
+		""" Returns True if action went down this frame """
+		return action in cls.input.pressed
+
+
+	@classmethod
+	def action_released(cls, action):
+		""" Returns True if action was let go of this frame """
+		return action in cls.input.released
+
+
 	##############################################
 	# PROCESS INTERACTION
 	##############################################
@@ -561,22 +1613,45 @@ class Program:
 		return retlist
 
 
+	@classmethod
+	def class_names(cls, klass):
+		"""
+		Returns the names of a class and all of its base classes, these are
+		the type buckets a process of that class is filed under.
+		"""
+		try:
+			return cls.class_names_cache[klass]
+		except KeyError:
+			names = set(k.__name__ for k in inspect.getmro(klass) if k is not object)
+			# compact processes count as Process too
+			if issubclass(klass, BaseProcess):
+				names.add("Process")
+			names = tuple(names)
+			cls.class_names_cache[klass] = names
+			return names
+
+
+	@classmethod
+	def type_bucket(cls, type_name):
+		"""
+		Returns the dictionary of id -> process for every process whose class,
+		or one of its base classes, has the given name. Must not be modified.
+		"""
+		return cls.processes_by_class.get(type_name, EMPTY_BUCKET)
+
+
 	@classmethod
 	def processes_by_type(cls, type_name):
 		"""
-		Returns a list of processes with a particular class name.
+		Returns a list of processes with a particular class name, or of a
+		particular class. Subclasses are included.
 		"""
-		process_list = []
-		
-		for obj in cls.processes:
-			if type(type_name) == type(""):
-				if cls.processes[obj].__class__.__name__ == type_name:
-					process_list.append(cls.processes[obj])
-			else:
-				if isinstance(cls.processes[obj], type_name):
-					process_list.append(cls.processes[obj])
-				
-		return process_list
+		if type(type_name) == type(""):
+			return cls.type_bucket(type_name).values()
+		if type_name is Process:
+			type_name = BaseProcess
+
+		return [obj for obj in cls.type_bucket(type_name.__name__).itervalues() if isinstance(obj, type_name)]
 	
 
 	@classmethod		
@@ -605,7 +1680,7 @@ class Program:
 				cls.signal(p, signal_code, tree)	
 		
 		# We've entered a process type
-		elif isinstance(process, type) and issubclass(process, Process):						
+		elif isinstance(process, type) and issubclass(process, BaseProcess):						
 			
 			for obj in cls.processes_by_type(process):
 				cls.single_object_signal(obj, signal_code, tree)
@@ -613,13 +1688,8 @@ class Program:
 		# We've entered a specific type as a string
 		elif type(process) == type(""):
 			
-			import copy
-			process_iter = copy.copy(cls.processes)
-			
-			#TODO: maybe hash by process type?
-			for obj in process_iter:
-				if cls.processes[obj].__class__.__name__ == process:
-					cls.single_object_signal(cls.processes[obj], signal_code, tree)
+			for obj in cls.processes_by_type(process):
+				cls.single_object_signal(obj, signal_code, tree)
 
 		# We've entered an ID number
 		elif type(process) == type(1):
@@ -640,11 +1710,7 @@ class Program:
 	def exists(cls, process_id):
 		
 		if type(process_id) == type(""):
-			for obj in cls.processes:
-				if cls.processes[obj].__class__.__name__ == process_id:
-					return True
-				
-			return False
+			return len(cls.type_bucket(process_id)) > 0
 
 		elif type(process_id) == type(1):
 			
@@ -668,6 +1734,7 @@ class Program:
 		# do this one
 		if signal_code == S_KILL:
 			cls.kill_process(process.id)
+			return
 		elif signal_code == S_WAKEUP:
 			process.status = 0
 		elif signal_code == S_SLEEP:
@@ -675,10 +1742,24 @@ class Program:
 		elif signal_code == S_FREEZE:
 			process.status = S_FREEZE		 
 		
+		if getattr(process, "_static", False):
+			cls.static_changed(process)
+		
 		
 	##############################################
 	# MATH STUFF
 	##############################################
+	@classmethod
+	def set_trig_tables(cls, resolution = 100):
+		"""
+		Makes fget_angle, get_distx, get_disty and Process.xadvance look
+		their sines, cosines and arc tangents up in tables with an entry
+		every resolution millidegrees, rather than asking libm. Their results
+		are then the same on every machine, which replays need, and
+		Process.fixed_advance can be used. None goes back to libm.
+		"""
+		cls.trig = None if resolution == None else TrigTables(resolution)
+	
 	@classmethod 
 	def normalise_angle(cls, angle):
 		"""
@@ -690,6 +1771,14 @@ class Program:
 			angle += 360000 * ((-angle-180000)//360000 + 1)
 		return angle
 	
+	@classmethod
+	def quantize_angle(cls, angle, steps):
+		"""
+		Returns the nearest of steps angles evenly spaced around the circle,
+		starting at 0, between 0 and 360000
+		"""
+		return (int(round(angle * steps / 360000.0)) % steps) * 360000.0 / steps
+	
 	@classmethod
 	def angle_difference(cls, start_angle, end_angle):
 		"""
@@ -725,14 +1814,16 @@ class Program:
 		difference = cls.angle_difference(curr_angle, targ_angle)
 			
 		# do increment
-		if math.fabs(difference) < increment:
+		if abs(difference) < increment:
 			return targ_angle
 		else:
-			dir = difference / math.fabs(difference)
+			dir = difference / abs(difference)
 			return curr_angle + increment*dir
 	
 	@classmethod	
 	def fget_angle(cls, pointax, pointay, pointbx, pointby):
+		if cls.trig != None:
+			return cls.trig.atan2(-(pointby - pointay), pointbx - pointax)
 		return math.degrees(math.atan2(-(pointby - pointay), pointbx - pointax))*1000
 
 
@@ -741,9 +1832,82 @@ class Program:
 		return int(math.sqrt((math.pow((pointby - pointay), 2) + math.pow((pointbx - pointax), 2))))
 
 
+	@classmethod
+	def group_members(cls, group, origin = None):
+		"""
+		Returns the processes in group, a type name, a class or a list of
+		processes, leaving out origin and any that have died
+		"""
+		if type(group) == type("") or isinstance(group, type):
+			members = cls.processes_by_type(group)
+		else:
+			processes = cls.processes
+			members = [obj for obj in group if processes.get(obj.id) is obj]
+		if origin in members:
+			members.remove(origin)
+		return members
+
+
+	@classmethod
+	def offsets(cls, origin, group):
+		""" Returns group's members and an array of how far across and up each one is from origin """
+		if numpy == None:
+			raise ImportError("distance and angle queries over groups need numpy")
+		members = cls.group_members(group, origin)
+		x, y = (origin.x, origin.y) if isinstance(origin, BaseProcess) else origin
+		positions = numpy.array([(obj.x, obj.y) for obj in members], float).reshape(-1, 2)
+		return members, positions[:, 0] - x, y - positions[:, 1]
+
+
+	@classmethod
+	def distances(cls, origin, group):
+		"""
+		Returns the members of group, as group_members would, and a numpy
+		array of their distances in pixels from origin, a process or an (x, y)
+		point. Like fget_dist for each of them, but not rounded.
+		"""
+		members, across, up = cls.offsets(origin, group)
+		return members, numpy.hypot(across, up)
+
+
+	@classmethod
+	def angles(cls, origin, group):
+		"""
+		Returns the members of group and a numpy array of the angles from
+		origin to each of them, as fget_angle would give
+		"""
+		members, across, up = cls.offsets(origin, group)
+		if cls.trig != None:
+			return members, cls.trig.atan2_array(up, across)
+		return members, numpy.degrees(numpy.arctan2(up, across)) * 1000
+
+
+	@classmethod
+	def nearest(cls, origin, group, count = 1, within = None):
+		"""
+		Returns a list of up to count members of group nearest to origin,
+		nearest first, leaving out any further away than within if given
+		"""
+		if count < 1:
+			return []
+		members, distances = cls.distances(origin, group)
+		if within != None:
+			close = numpy.nonzero(distances <= within)[0]
+		else:
+			close = numpy.arange(len(members))
+		if len(close) > count:
+			# only the nearest count need sorting
+			close = close[numpy.argpartition(distances[close], count - 1)[:count]]
+		close = close[numpy.argsort(distances[close], kind = "mergesort")]
+		return [members[i] for i in close]
+
+
 	@classmethod
 	def get_distx(cls, angle, distance):
 		""" Returns the horisontal distance in pixels of a specified displacement. """
+		trig = cls.trig
+		if trig != None:
+			return int(trig.cos_table[int((angle + trig.half) // trig.resolution) % trig.size] * distance)
 		return int(math.cos(
 							math.radians(angle/1000)
 							) * distance)
@@ -752,6 +1916,9 @@ class Program:
 	@classmethod
 	def get_disty(cls, angle, distance):
 		""" Returns the vertical distance in pixels of a specified displacement. """
+		trig = cls.trig
+		if trig != None:
+			return -int(trig.sin_table[int((angle + trig.half) // trig.resolution) % trig.size] * distance)
 		return -int(math.sin(
 							 math.radians(angle/1000)
 							 ) * distance)
@@ -763,13 +1930,49 @@ class Program:
 	@classmethod	
 	def load_png(cls, filename, colorkey = None, namehint=""):
 		""" Loads a file into memory and converts it accordingly """
-		try:
-			image = pygame.image.load(filename,namehint)
-		except pygame.error, message:
-			print 'Cannot load image:', filename
-			raise SystemExit, message
+		started = default_timer()
+		image = None
+		if cls.baked_assets != None:
+			image = cls.baked_assets.image(filename)
 		
-		image = image.convert_alpha()
+		if image == None:
+			try:
+				image = pygame.image.load(filename,namehint)
+			except pygame.error, message:
+				print 'Cannot load image:', filename
+				raise SystemExit, message
+		
+		image = cls.convert_png(image, colorkey, filename)
+		cls.startup.load("png", started)
+		return image
+
+
+	@classmethod
+	def bake(cls, bake, filename, value):
+		"""
+		Bakes value through bake, one of baked_assets' bake methods, turning
+		baking off if it can't write the file
+		"""
+		try:
+			bake(filename, value)
+		except (OSError, IOError), error:
+			print 'Cannot bake assets into %s, decoding every time:' % cls.baked_assets.directory, error
+			cls.set_baked_assets(None)
+
+
+	@classmethod
+	def convert_png(cls, image, colorkey = None, filename = None):
+		"""
+		Converts a freshly loaded image to the screen format, has to run on
+		the main thread. With baked assets on, the result is baked for next
+		time, and baked images are already converted.
+		"""
+		if cls.baked_assets == None:
+			image = image.convert_alpha()
+		elif not cls.baked_assets.is_native(image):
+			image = image.convert_alpha()
+			if filename != None:
+				cls.bake(cls.baked_assets.bake_image, filename, image)
 
 		if colorkey is not None:
 			image.set_colorkey(colorkey)
@@ -779,6 +1982,109 @@ class Program:
 		return image
 
 
+	@classmethod
+	def cached_png(cls, filename, colorkey = None):
+		"""
+		Like load_png, but each file is only loaded once and the same surface
+		is handed to everyone asking for it, so it mustn't be drawn on. Held
+		in Program.assets under its current scope.
+		"""
+		if colorkey is None:
+			graph = cls.atlas_graph(filename)
+			if graph != None:
+				return graph
+		return cls.assets.load("png", filename, cls.load_png, surface_bytes, colorkey)
+
+
+	@classmethod
+	def load_atlas(cls, index_path):
+		"""
+		Loads an atlas built with fenix.atlas. From then on cached_png hands
+		out subsurfaces of its sheets for the files packed into it.
+		"""
+		atlas = Atlas(index_path, cls.load_png)
+		cls.atlases.append(atlas)
+		return atlas
+
+
+	@classmethod
+	def set_baked_assets(cls, directory):
+		"""
+		Keeps images and sounds in directory already decoded in the display
+		and mixer formats, baking each file the first time it's loaded. Call
+		after set_mode, None turns it off again, as does a directory that
+		can't be written to.
+		"""
+		if directory == None:
+			cls.baked_assets = None
+			cls.loader.decoders = dict(DECODERS)
+			return
+		try:
+			cls.baked_assets = BakedAssets(directory)
+		except (OSError, IOError), error:
+			print 'Cannot bake assets into %s, decoding every time:' % directory, error
+			cls.set_baked_assets(None)
+			return
+		cls.loader.decoders = {
+			"png": cls.baked_assets.decode_png,
+			"wav": cls.baked_assets.decode_wav,
+		}
+
+
+	@classmethod
+	def atlas_graph(cls, filename):
+		""" Returns the subsurface a loaded atlas holds for filename, or None """
+		for atlas in cls.atlases:
+			graph = atlas.get(filename)
+			if graph != None:
+				return graph
+		return None
+
+
+	@classmethod
+	def preload(cls, scope, pngs = (), wavs = ()):
+		"""
+		Starts loading image and sound files in the background for scope,
+		usually the next level. Once assets_ready says they're done they
+		are in Program.assets claimed by scope, so cached_png and cached_wav
+		hand them out straight away.
+		"""
+		if wavs:
+			# sounds can only be made once the mixer is going
+			cls.require(pygame.mixer)
+		keys = [cls.assets.key("png", filename, None) for filename in pngs if cls.atlas_graph(filename) == None]
+		keys += [cls.assets.key("wav", filename) for filename in wavs]
+		for key in keys:
+			if not cls.assets.claim(scope, key):
+				cls.loader.request(scope, key)
+
+
+	@classmethod
+	def assets_ready(cls, scope):
+		""" True once everything preloaded for scope has finished loading """
+		# Headless runs have to be reproducible, so they don't race the loader
+		if cls.headless:
+			cls.loader.wait(scope, cls.finish_asset)
+		return cls.loader.ready(scope)
+
+
+	@classmethod
+	def finish_asset(cls, scopes, key, decoded, error):
+		""" Called on the main thread with each file the loader has decoded """
+		kind, filename = key[0], key[1]
+		if error != None:
+			print 'Cannot load %s:' % ("image" if kind == "png" else "sound"), filename
+			raise SystemExit, error
+
+		if kind == "png":
+			value = cls.convert_png(decoded, key[2], filename)
+			cls.assets.store(scopes, key, value, surface_bytes(value))
+		else:
+			if cls.baked_assets != None:
+				cls.bake(cls.baked_assets.bake_sound, filename, decoded)
+			cls.assets.store(scopes, key, decoded, sound_bytes(decoded))
+
+
 	@classmethod
 	def save_png(cls, graph, filename):
 		""" 
@@ -791,6 +2097,64 @@ class Program:
 	##############################################
 	# GRAPHIC MANIPULATION
 	##############################################
+	@classmethod
+	def transform_surface(cls, graph, size = 100, angle = 0, flags = 0, alpha = 255, size_y = None):
+		"""
+		Returns a new surface of graph scaled, rotated, mirrored and faded
+		the way a process with those values would be drawn. size_y scales
+		the height on its own, size scales both if it isn't given.
+		"""
+		transformed = graph
+		if size_y == None:
+			size_y = size
+
+		if size != 100 or size_y != 100:
+			graph_size = graph.get_size()
+			new_width = int(graph_size[0] * (size / 100.0))
+			new_height = int(graph_size[1] * (size_y / 100.0))
+			transformed = pygame.transform.scale(transformed, (new_width, new_height))
+			
+		if angle != 0:
+			transformed = pygame.transform.rotate(transformed, angle / 1000)
+			
+		if flags & (B_HMIRROR | B_VMIRROR):
+			transformed = pygame.transform.flip(transformed, (True if flags & B_HMIRROR else False), (True if flags & B_VMIRROR else False))
+
+		# Only copy when nothing above made a new surface to set the alpha on
+		if transformed is graph:
+			transformed = graph.copy()
+
+		if flags & B_TRANSLUCENT:
+			transformed.set_alpha(int(round(255/2)))
+		else:
+			transformed.set_alpha(alpha)
+
+		return transformed
+
+
+	@classmethod
+	def prerender_rotations(cls, graph, steps, size = 100, flags = 0, alpha = 255):
+		"""
+		Puts every rotation of graph a process with rotation_steps set to
+		steps can draw into the transform cache, so none of them has to be
+		made mid game. The cache budget needs room for them all.
+		"""
+		for index in range(1, steps):
+			angle = index * 360000.0 / steps
+			key = (graph, size, angle, flags, alpha)
+			if key not in cls.transform_cache:
+				cls.transform_cache.put(key, cls.transform_surface(graph, size, angle, flags, alpha))
+
+
+	@classmethod
+	def set_transform_cache_budget(cls, budget):
+		"""
+		Sets how many bytes of scaled/rotated graphics are kept around for
+		processes to share. Least recently used ones are dropped first.
+		"""
+		cls.transform_cache.set_budget(budget)
+
+
 	@classmethod	
 	def new_map(cls, width, height):
 		"""
@@ -871,19 +2235,7 @@ class Program:
 		""" 
 		Draws a surface on to another surface at specified coords with extra params
 		"""
-		# TODO: Flags
-		altered = origin_graph.copy()
-		
-		if size != 100:
-			graph_size = altered.get_size()
-			new_width = int(graph_size[0] * (size / 100.0))
-			new_height = int(graph_size[1] * (size / 100.0))
-			altered = pygame.transform.scale(altered, (new_width, new_height))
-
-		if angle != 0:
-			altered = pygame.transform.rotate(altered, angle / 1000)
-		
-		dest_graph.blit(altered, (x, y))
+		cls.map_xputnp(dest_graph, origin_graph, x, y, angle, size, size, flags)
 
 
 	@classmethod
@@ -891,20 +2243,33 @@ class Program:
 		""" 
 		Like map_xput but allows you to set the width/height specifically
 		"""
-		# TODO: Flags
-		altered = origin_graph.copy()
+		special_flags = 0
+		if flags & B_ABLEND:
+			special_flags = BLEND_ADD
+		elif flags & B_SBLEND:
+			special_flags = BLEND_SUB
 		
-		if scale_x != 100 or scale_y != 100:
-			graph_size = altered.get_size()
-			new_width = int(graph_size[0] * (scale_x / 100.0))
-			new_height = int(graph_size[1] * (scale_y / 100.0))
-			altered = pygame.transform.scale(altered, (new_width, new_height))
+		dest_graph.blit(cls.map_transform(origin_graph, angle, scale_x, scale_y, flags), (x, y), None, special_flags)
 
-		if angle != 0:
-			altered = pygame.transform.rotate(altered, angle / 1000)
-			
-		dest_graph.blit(altered, (x, y))
+
+	@classmethod
+	def map_transform(cls, graph, angle, scale_x, scale_y, flags):
+		"""
+		Returns graph scaled, rotated, mirrored and faded for map_xputnp. They
+		are kept in the transform cache, so graph mustn't be drawn on after
+		being put with any of those.
+		"""
+		flags &= B_HMIRROR | B_VMIRROR | B_TRANSLUCENT
+		if angle == 0 and scale_x == 100 and scale_y == 100 and flags == 0:
+			return graph
 		
+		# tagged, processes keep their own transforms in the same cache
+		key = ("map", graph, angle, scale_x, scale_y, flags)
+		transformed = cls.transform_cache.get(key)
+		if transformed == None:
+			transformed = cls.transform_cache.put(key,
+				cls.transform_surface(graph, scale_x, angle, flags, 255, scale_y))
+		return transformed
 
 	
 	##############################################
@@ -912,7 +2277,30 @@ class Program:
 	##############################################
 	@classmethod	
 	def load_fnt(cls, filename, size = 20):
-		return pygame.font.Font(filename, size)
+		cls.require(pygame.font)
+		started = default_timer()
+		font = pygame.font.Font(filename, size)
+		cls.startup.load("fnt", started)
+		return font
+	
+	
+	@classmethod
+	def render_text(cls, font, text, colour = (255,255,255), antialias = True):
+		"""
+		Returns a surface with the text rendered in font. Surfaces are cached,
+		so the same label in the same font and colour is only rendered once.
+		"""
+		key = (font, text, colour, antialias)
+		graph = cls.text_cache.get(key)
+		if graph == None:
+			graph = cls.text_cache.put(key, font.render(text, antialias, colour))
+		return graph
+	
+	
+	@classmethod
+	def cached_fnt(cls, filename, size = 20):
+		""" Like load_fnt, but each file and size is only loaded once """
+		return cls.assets.load("fnt", filename, cls.load_fnt, lambda font: 0, size)
 	
 	
 	@classmethod	
@@ -932,19 +2320,37 @@ class Program:
 	@classmethod
 	def load_wav(cls, filename):
 		"""Loads the specified sound file into memory and returns a sound object"""
-		try:
-			sound = pygame.mixer.Sound(filename)
-		except pygame.error, message:
-			print 'Cannot load sound:', filename
-			raise SystemExit, message
+		cls.require(pygame.mixer)
+		started = default_timer()
+		sound = None
+		if cls.baked_assets != None:
+			sound = cls.baked_assets.sound(filename)
 		
+		if sound == None:
+			try:
+				sound = pygame.mixer.Sound(filename)
+			except pygame.error, message:
+				print 'Cannot load sound:', filename
+				raise SystemExit, message
+			
+			if cls.baked_assets != None:
+				cls.bake(cls.baked_assets.bake_sound, filename, sound)
+		
+		cls.startup.load("wav", started)
 		return sound		
 	
+	@classmethod
+	def cached_wav(cls, filename):
+		"""Like load_wav, but each file is only loaded once and the sound object shared"""
+		return cls.assets.load("wav", filename, cls.load_wav, sound_bytes)
+	
 	@classmethod
 	def play_wav(cls, wav, repeats=0, volume=128):
 		"""Starts a sound playing and returns the id of the channel used. 'repeats'
 			sets the number of times to play the sound after the initial play. -1
-			can be used to loop the sound forever."""
+			can be used to loop the sound forever. Returns None when sound is off."""
+		if not cls.sound_enabled:
+			return None
 		channel = wav.play(repeats)
 		channel.set_volume(volume/128.0)
 		try:
@@ -953,6 +2359,11 @@ class Program:
 			cls.channels.append(channel)
 			return len(cls.channels)-1
 	
+	@classmethod
+	def set_sound(cls, enabled = True):
+		"""Turns sound effects on or off. While off play_wav does nothing."""
+		cls.sound_enabled = enabled
+	
 	@classmethod
 	def pause_wav(cls, channel):
 		"""Pauses playback of sound on the specified channel. -1 can be used to stop 
@@ -0,0 +1,85 @@
+""" Uniform grid used as a broadphase for collision checks """
+
+
+class SpatialHash(object):
+	""" Files processes into square cells by the rect they were last drawn with,
+	so collision checks only need to look at processes in nearby cells """
+
+	def __init__(self, cell_size = 64):
+		self.cell_size = cell_size
+		self.cells = {}
+		self.bounds = {}
+
+
+	def cell_bounds(self, rect):
+		""" Returns the (first column, first row, last column, last row) covered by a rect """
+		# pygame still reports overlaps for zero sized rects, so they get a cell too
+		size = self.cell_size
+		return (rect.left // size, rect.top // size,
+				max(rect.left, rect.right - 1) // size, max(rect.top, rect.bottom - 1) // size)
+
+
+	def update(self, obj):
+		""" Moves a process to the cells covered by its current rect.
+		Does nothing if it still covers the same cells. """
+		bounds = self.cell_bounds(obj.rect)
+		old_bounds = self.bounds.get(obj.id)
+		if old_bounds == bounds:
+			return
+
+		if old_bounds != None:
+			self.remove(obj)
+
+		cells = self.cells
+		for cx in xrange(bounds[0], bounds[2] + 1):
+			for cy in xrange(bounds[1], bounds[3] + 1):
+				cell = cells.get((cx, cy))
+				if cell == None:
+					cell = cells[(cx, cy)] = {}
+				cell[obj.id] = obj
+
+		self.bounds[obj.id] = bounds
+
+
+	def remove(self, obj):
+		""" Takes a process out of the grid """
+		bounds = self.bounds.pop(obj.id, None)
+		if bounds == None:
+			return
+
+		cells = self.cells
+		for cx in xrange(bounds[0], bounds[2] + 1):
+			for cy in xrange(bounds[1], bounds[3] + 1):
+				cell = cells[(cx, cy)]
+				del cell[obj.id]
+				if not cell:
+					del cells[(cx, cy)]
+
+
+	def query(self, rect):
+		""" Returns a dictionary of id -> process for everything sharing a cell with rect """
+		bounds = self.cell_bounds(rect)
+		cells = self.cells
+
+		# The common case of a small sprite inside a single cell needs no merging
+		if bounds[0] == bounds[2] and bounds[1] == bounds[3]:
+			return cells.get((bounds[0], bounds[1]), {})
+
+		found = {}
+		for cx in xrange(bounds[0], bounds[2] + 1):
+			for cy in xrange(bounds[1], bounds[3] + 1):
+				cell = cells.get((cx, cy))
+				if cell:
+					found.update(cell)
+		return found
+
+
+	def query_point(self, point):
+		""" Returns a dictionary of id -> process for everything in the cell holding point """
+		size = self.cell_size
+		return self.cells.get((int(point[0]) // size, int(point[1]) // size), {})
+
+
+	def clear(self):
+		self.cells = {}
+		self.bounds = {}
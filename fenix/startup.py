@@ -0,0 +1,57 @@
+""" Where the time goes between starting the game and its first frame """
+
+from timeit import default_timer
+
+
+class StartupTimeline(object):
+	""" Spans of start up work, timed from when this was made. Finished by
+	Program once the first frame has been shown. """
+
+	def __init__(self):
+		self.start = default_timer()
+		self.spans = []
+		# kind -> [files loaded, seconds spent]
+		self.loads = {}
+		self.first_frame = None
+
+
+	def finished(self):
+		return self.first_frame != None
+
+
+	def span(self, name, started):
+		""" Records name as having run from started, a default_timer time, until now """
+		if self.first_frame == None:
+			self.spans.append((name, started - self.start, default_timer() - started))
+
+
+	def load(self, kind, started):
+		""" Adds a file of kind loaded since started to the load totals """
+		if self.first_frame == None:
+			totals = self.loads.setdefault(kind, [0, 0.0])
+			totals[0] += 1
+			totals[1] += default_timer() - started
+
+
+	def finish(self):
+		if self.first_frame == None:
+			self.first_frame = default_timer() - self.start
+
+
+	def summary(self):
+		""" Returns the timeline as a dictionary, times in milliseconds """
+		return {
+			"first_frame": 1000.0 * (self.first_frame or 0.0),
+			"spans": [{"name": name, "at": 1000.0 * at, "took": 1000.0 * took} for name, at, took in self.spans],
+			"loads": dict((kind, {"files": files, "took": 1000.0 * took}) for kind, (files, took) in self.loads.iteritems()),
+		}
+
+
+	def report_lines(self):
+		lines = ["startup: first frame after %.1f ms" % (1000.0 * (self.first_frame or 0.0))]
+		for name, at, took in self.spans:
+			lines.append("%9.1f ms %8.1f ms  %s" % (1000.0 * at, 1000.0 * took, name))
+		for kind in sorted(self.loads):
+			files, took = self.loads[kind]
+			lines.append("%s: %d files in %.1f ms" % (kind, files, 1000.0 * took))
+		return lines
@@ -0,0 +1,111 @@
+""" Lookup tables for the engine's millidegree trigonometry, see Program.set_trig_tables """
+
+import math
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+
+# Fixed point numbers have this many bits after the point
+FIXED_BITS = 16
+FIXED_ONE = 1 << FIXED_BITS
+
+
+class TrigTables(object):
+	"""
+	Sine, cosine and arc tangent of millidegree angles, to within
+	resolution millidegrees. Everything is worked out in whole numbers
+	from tables of fixed point values, which are rounded so finely that
+	any libm builds them the same, so the same input gives exactly the
+	same result on every machine. The float versions are the fixed point
+	values divided by FIXED_ONE.
+	"""
+
+	def __init__(self, resolution = 100):
+		""" resolution is the angle between table entries, it has to divide 360000 """
+		if resolution <= 0 or 360000 % resolution:
+			raise ValueError("resolution has to divide 360000 millidegrees, not %r" % (resolution,))
+		self.resolution = resolution
+		self.half = resolution // 2
+		self.size = 360000 // resolution
+
+		self.fixed_cos_table = []
+		self.fixed_sin_table = []
+		for i in range(self.size):
+			radians = math.radians(i * resolution / 1000.0)
+			self.fixed_cos_table.append(int(round(math.cos(radians) * FIXED_ONE)))
+			self.fixed_sin_table.append(int(round(math.sin(radians) * FIXED_ONE)))
+		self.cos_table = [value / float(FIXED_ONE) for value in self.fixed_cos_table]
+		self.sin_table = [value / float(FIXED_ONE) for value in self.fixed_sin_table]
+
+		# arc tangents in millidegrees of ratios from 0 to 1, close enough
+		# together that neighbours are at most resolution apart
+		self.atan_steps = int(math.ceil(180000 / (math.pi * resolution)))
+		self.atan_table = [int(round(math.degrees(math.atan(i / float(self.atan_steps))) * 1000))
+			for i in range(self.atan_steps + 1)]
+
+
+	def index(self, angle):
+		"""
+		Returns the entry nearest to angle, which can be any number of turns
+		either way. Hot paths do this inline, a method call costs as much as
+		asking libm.
+		"""
+		return int((angle + self.half) // self.resolution) % self.size
+
+
+	def cos(self, angle):
+		return self.cos_table[self.index(angle)]
+
+
+	def sin(self, angle):
+		return self.sin_table[self.index(angle)]
+
+
+	def fixed_cos(self, angle):
+		return self.fixed_cos_table[self.index(angle)]
+
+
+	def fixed_sin(self, angle):
+		return self.fixed_sin_table[self.index(angle)]
+
+
+	def atan2(self, y, x):
+		""" Returns the angle of the point x, y from the origin in millidegrees, between -180000 and 180000 """
+		ax = abs(x)
+		ay = abs(y)
+		if ax == 0 and ay == 0:
+			return 0
+
+		# the table covers the first half of the first quarter, mirror the rest onto it
+		steps = self.atan_steps
+		if ay <= ax:
+			angle = self.atan_table[int((2 * ay * steps + ax) // (2 * ax))]
+		else:
+			angle = 90000 - self.atan_table[int((2 * ax * steps + ay) // (2 * ay))]
+
+		if x < 0:
+			angle = 180000 - angle
+		if y < 0:
+			angle = -angle
+		return angle
+
+
+	def atan2_array(self, y, x):
+		""" atan2 over numpy arrays, needs numpy """
+		ax = numpy.abs(x)
+		ay = numpy.abs(y)
+		low = ay <= ax
+		big = numpy.where(low, ax, ay)
+		small = numpy.where(low, ay, ax)
+		# the origin itself comes out as 0
+		big_or_one = numpy.where(big == 0, 1, big)
+
+		steps = self.atan_steps
+		angle = numpy.array(self.atan_table)[((2 * small * steps + big_or_one) // (2 * big_or_one)).astype(int)]
+		angle = numpy.where(low, angle, 90000 - angle)
+		angle = numpy.where(x < 0, 180000 - angle, angle)
+		angle = numpy.where(y < 0, -angle, angle)
+		return numpy.where(big == 0, 0, angle)